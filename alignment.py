@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Alignment_Engine object which aligns two lists of words
+    and returns the differences as opcodes. """
+
+import os
+import difflib
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from word_stream import Vocabulary, Word_Stream
+from spelling_variants import map_variants
+
+class Alignment_Engine:
+    """ Aligns two lists of words (e.g. the words of an original and of a
+        censored edition) and returns a list of opcodes like
+        difflib.SequenceMatcher.get_opcodes():
+
+            (tag, i1, i2, j1, j2) with tag = 'equal', 'delete', 'insert' or 'replace'
+            -> list_1[i1:i2] was replaced by list_2[j1:j2]
+
+        algorithm -- "histogram": splits the lists at their rarest common words
+                     and aligns the parts recursively (like "git diff
+                     --histogram"). Fast for long texts that mostly match.
+                     "myers": Eugene W. Myers' O(ND) difference algorithm
+                     (in linear space).
+                     "differ": difflib.Differ, the former implementation. It
+                     compares the characters of similar words in every replaced
+                     block, which is very slow for long texts.
+        fuzzy     -- if True, every replaced block found by "histogram" or "myers"
+                     is compared again with difflib.Differ so that similar words
+                     are paired (e.g. "diferences" and "differences"). Only the
+                     (short) replaced blocks are compared this way.
+        anchor_size -- if > 0, the lists are first divided at anchors, i.e.
+                     sequences of anchor_size words which occur exactly once in
+                     both lists and in the same order (like "git diff --patience").
+                     Only the gaps between the anchors are aligned with the
+                     algorithm. (Not used by "differ".)
+        processes -- the gaps are aligned by this number of processes (None =
+                     the number of CPUs) if they contain at least parallel_words
+                     words together. Otherwise, they are aligned one by one.
+        variants  -- if True, spelling variants count as equal words: every
+                     word of list_2 which does not occur in list_1 but differs
+                     from a word of list_1 by a few letters (e.g. "præsens" and
+                     "praesens", cf. spelling_variants.py) is compared as that
+                     word. (Not used by "differ".)
+
+        The words are compared by their integer IDs (cf. word_stream.py). """
+
+    ALGORITHMS = ("histogram", "myers", "differ")
+
+    def __init__(self, algorithm="histogram", fuzzy=False, anchor_size=4, processes=None,
+                 parallel_words=100000, variants=False):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"Unknown alignment algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.fuzzy = fuzzy
+        self.anchor_size = anchor_size
+        self.processes = processes if processes is not None else os.cpu_count() or 1
+        self.parallel_words = parallel_words
+        self.variants = variants
+
+    def opcodes(self, list_1, list_2):
+        """ Returns the opcodes transforming list_1 into list_2 as a list
+            (cf. iter_opcodes()). """
+        return list(self.iter_opcodes(list_1, list_2))
+
+    def iter_opcodes(self, list_1, list_2):
+        """ Yields the opcodes transforming list_1 into list_2. The lists
+            are lists of words or Word_Streams. The IDs of Word_Streams
+            sharing a Vocabulary are compared directly.
+
+            With anchors, the first opcodes are yielded as soon as the first
+            gap has been aligned, i.e. long before the end of the lists. """
+        if self.algorithm == "differ":
+            yield from differ_opcodes(list(list_1), list(list_2))
+            return
+
+        if (isinstance(list_1, Word_Stream) and isinstance(list_2, Word_Stream)
+                and list_1.vocabulary is list_2.vocabulary):
+            vocabulary = list_1.vocabulary
+            a, b = list_1.ids, list_2.ids
+        else:
+            vocabulary = Vocabulary()
+            a, b = vocabulary.encode(list_1), vocabulary.encode(list_2)
+        if self.variants:
+            b = map_variants(vocabulary, a, b)
+        if self.anchor_size > 0:
+            opcodes = self.anchored_diff(a, b)
+        else:
+            opcodes = iter(_align_gap((self.algorithm, a, b)))
+
+        if self.fuzzy:
+            opcodes = self.refine(opcodes, list_1, list_2)
+        yield from opcodes
+
+    def anchored_diff(self, a, b):
+        """ Divides the lists of IDs a and b at their anchors and aligns the
+            gaps between the anchors. Yields the opcodes. """
+        segments = []  # equal runs and gaps (alo, ahi, blo, bhi)
+        alo = blo = 0
+        for i, j, length in find_anchors(a, b, self.anchor_size):
+            segments.append(("gap", alo, i, blo, j))
+            segments.append(("equal", i, i + length, j, j + length))
+            alo, blo = i + length, j + length
+        segments.append(("gap", alo, len(a), blo, len(b)))
+
+        gaps = [segment for segment in segments
+                if segment[0] == "gap" and segment[1] < segment[2] and segment[3] < segment[4]]
+        jobs = ((self.algorithm, a[alo:ahi], b[blo:bhi]) for _, alo, ahi, blo, bhi in gaps)
+        gap_words = sum(ahi - alo + bhi - blo for _, alo, ahi, blo, bhi in gaps)
+        if self.processes > 1 and gap_words >= self.parallel_words:
+            executor = ProcessPoolExecutor(self.processes)
+            # (The results are returned in order as soon as they are ready.)
+            results = executor.map(_align_gap, jobs,
+                                   chunksize=max(1, len(gaps) // (4 * self.processes)))
+        else:
+            executor = None
+            results = map(_align_gap, jobs)
+
+        def opcodes():
+            for tag, alo, ahi, blo, bhi in segments:
+                if tag == "equal":
+                    yield (tag, alo, ahi, blo, bhi)
+                elif alo < ahi and blo < bhi:
+                    for sub_tag, i1, i2, j1, j2 in next(results):
+                        yield (sub_tag, alo + i1, alo + i2, blo + j1, blo + j2)
+                elif alo < ahi:
+                    yield ("delete", alo, ahi, blo, bhi)
+                elif blo < bhi:
+                    yield ("insert", alo, ahi, blo, bhi)
+        try:
+            yield from iter_merged(opcodes())
+        finally:
+            if executor:
+                executor.shutdown()
+
+    @staticmethod
+    def refine(opcodes, list_1, list_2):
+        """ Compares the words in every replaced block with difflib.Differ
+            and splits the block accordingly. Yields the opcodes. """
+        def refined():
+            for tag, i1, i2, j1, j2 in opcodes:
+                if tag != "replace":
+                    yield (tag, i1, i2, j1, j2)
+                    continue
+                for sub_tag, k1, k2, l1, l2 in differ_opcodes(list_1[i1:i2], list_2[j1:j2]):
+                    yield (sub_tag, i1 + k1, i1 + k2, j1 + l1, j1 + l2)
+        return iter_merged(refined())
+
+
+# Helper functions:
+
+def merge_opcodes(opcodes):
+    """ Returns the opcodes merged by iter_merged() as a list. """
+    return list(iter_merged(opcodes))
+
+def iter_merged(opcodes):
+    """ Merges neighbouring opcodes with the same tag. A 'delete' next to an
+        'insert' becomes a 'replace'. Empty opcodes are dropped. Yields the
+        opcodes as soon as they are complete. """
+    last = None
+    for tag, i1, i2, j1, j2 in opcodes:
+        if i1 == i2 and j1 == j2:
+            continue
+        if last:
+            last_tag, k1, _, l1, _ = last
+            if last_tag == tag or (last_tag != "equal" and tag != "equal"):
+                last = (tag if last_tag == tag else "replace", k1, i2, l1, j2)
+                continue
+            yield last
+        last = (tag, i1, i2, j1, j2)
+    if last:
+        yield last
+
+def _align_gap(job):
+    """ Aligns two lists of IDs with an algorithm. job = (algorithm, a, b)
+        (one argument for ProcessPoolExecutor.map()). """
+    algorithm, a, b = job
+    if algorithm == "histogram":
+        return histogram_diff(a, b)
+    return myers_diff(a, b)
+
+def find_anchors(a, b, size):
+    """ Returns the anchors of the lists a and b as (i, j, length) tuples:
+        runs of equal words starting with a sequence of size words which
+        occurs exactly once in a and in b. The anchors are in the same order in
+        both lists (the longest increasing sequence of the unique matches,
+        found by patience sorting) and do not overlap. """
+    def unique_ngrams(sequence):
+        ngrams = {}
+        for position, ngram in enumerate(zip(*(sequence[k:] for k in range(size)))):
+            ngrams[ngram] = -1 if ngram in ngrams else position
+        return ngrams
+
+    ngrams_b = unique_ngrams(b)
+    matches = [(i, ngrams_b[ngram]) for ngram, i in unique_ngrams(a).items()
+               if i >= 0 and ngrams_b.get(ngram, -1) >= 0]
+    matches.sort()
+
+    # The longest increasing sequence of the positions in b (patience sorting):
+    tails = []        # the smallest last j of the increasing sequences of length k + 1
+    tail_indices = []
+    previous = [-1] * len(matches)
+    for index, (_, j) in enumerate(matches):
+        k = bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[k] = j
+            tail_indices[k] = index
+        previous[index] = tail_indices[k - 1] if k > 0 else -1
+    sequence = []
+    index = tail_indices[-1] if tail_indices else -1
+    while index >= 0:
+        sequence.append(matches[index])
+        index = previous[index]
+    sequence.reverse()
+
+    # Extend the anchors as far as the words are equal. (An anchor starting
+    # inside the previous run is part of it or overlaps it.)
+    anchors = []
+    end_a = end_b = 0
+    for i, j in sequence:
+        if i < end_a or j < end_b:
+            continue
+        length = size
+        while i + length < len(a) and j + length < len(b) and a[i + length] == b[j + length]:
+            length += 1
+        anchors.append((i, j, length))
+        end_a, end_b = i + length, j + length
+    return anchors
+
+def differ_opcodes(list_1, list_2):
+    """ Runs difflib.Differ and converts its output to opcodes. Every word
+        marked with "-" or "+" becomes a 'delete' or 'insert' of its own,
+        in the order chosen by Differ. """
+    opcodes = []
+    i = j = 0
+    for line in difflib.Differ().compare(list_1, list_2):
+        code = line[:1]
+        if code == " ":
+            opcodes.append(("equal", i, i + 1, j, j + 1))
+            i += 1
+            j += 1
+        elif code == "-":
+            opcodes.append(("delete", i, i + 1, j, j))
+            i += 1
+        elif code == "+":
+            opcodes.append(("insert", i, i, j, j + 1))
+            j += 1
+    # Merge the equal words but keep the order of "-" and "+":
+    merged = []
+    for opcode in opcodes:
+        if merged and merged[-1][0] == opcode[0]:
+            tag, i1, _, j1, _ = merged[-1]
+            merged[-1] = (tag, i1, opcode[2], j1, opcode[4])
+        else:
+            merged.append(opcode)
+    return merged
+
+def _common_affixes(a, alo, ahi, b, blo, bhi):
+    """ Returns the lengths of the common prefix and suffix of a[alo:ahi]
+        and b[blo:bhi]. """
+    prefix = 0
+    while alo + prefix < ahi and blo + prefix < bhi and a[alo + prefix] == b[blo + prefix]:
+        prefix += 1
+    suffix = 0
+    while (ahi - suffix > alo + prefix and bhi - suffix > blo + prefix
+           and a[ahi - suffix - 1] == b[bhi - suffix - 1]):
+        suffix += 1
+    return prefix, suffix
+
+def myers_diff(a, b):
+    """ Returns the opcodes transforming the list a into the list b, using
+        Myers' algorithm with the "middle snake" (linear space). """
+    opcodes = []
+    _diff_ranges(a, 0, len(a), b, 0, len(b), opcodes, _myers_split)
+    return merge_opcodes(opcodes)
+
+def _myers_split(a, alo, ahi, b, blo, bhi):
+    """ Finds the middle snake of the shortest edit script of a[alo:ahi] and
+        b[blo:bhi] and returns a point (x, y) on it (relative to alo and blo),
+        or None if the ranges have nothing in common. """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    v1 = [-1] * (2 * max_d + 2)
+    v2 = [-1] * (2 * max_d + 2)
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0  # the paths meet in the forward pass
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        # Forward path:
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < len(v2) and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return x1, y1
+        # Reverse path:
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < len(v1) and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return x1, y1
+    return None
+
+def histogram_diff(a, b, max_chain=64, myers_below=32):
+    """ Returns the opcodes transforming the list a into the list b. The
+        ranges are split at the longest common run that contains the rarest
+        common word (words occurring up to max_chain times are considered).
+        Small ranges (less than myers_below words) are aligned with Myers'
+        algorithm. """
+    def split(a, alo, ahi, b, blo, bhi):
+        if ahi - alo < myers_below and bhi - blo < myers_below:
+            return _myers_split(a, alo, ahi, b, blo, bhi)
+        return _histogram_match(a, alo, ahi, b, blo, bhi, max_chain)
+
+    opcodes = []
+    _diff_ranges(a, 0, len(a), b, 0, len(b), opcodes, split)
+    return merge_opcodes(opcodes)
+
+def _histogram_match(a, alo, ahi, b, blo, bhi, max_chain):
+    """ Returns the start (relative to alo and blo) of the longest common
+        run of a[alo:ahi] and b[blo:bhi] which contains the word with the
+        lowest number of occurrences in a[alo:ahi], or None. """
+    occurrences = {}
+    for i in range(alo, ahi):
+        occurrences.setdefault(a[i], []).append(i)
+
+    # Words occurring more than max_chain times are only used if the ranges
+    # have no rarer word in common:
+    shared = [len(occurrences[word]) for word in set(b[blo:bhi]) if word in occurrences]
+    if not shared:
+        return None
+    limit = max(max_chain, min(shared))
+
+    best = None  # (lowest count, -length, i, j)
+    j = blo
+    while j < bhi:
+        positions = occurrences.get(b[j])
+        # (Words occurring more often than the best match so far are skipped.
+        # A run containing a rarer word is found when that word is reached.)
+        if positions is None or len(positions) > limit:
+            j += 1
+            continue
+        next_j = j + 1
+        for i in positions:
+            # Extend the match around (i, j) in both directions:
+            start_a, start_b = i, j
+            while start_a > alo and start_b > blo and a[start_a - 1] == b[start_b - 1]:
+                start_a -= 1
+                start_b -= 1
+            end_a, end_b = i + 1, j + 1
+            while end_a < ahi and end_b < bhi and a[end_a] == b[end_b]:
+                end_a += 1
+                end_b += 1
+            count = min(len(occurrences[a[k]]) for k in range(start_a, end_a))
+            candidate = (count, start_a - end_a, start_a, start_b)
+            if best is None or candidate < best:
+                best = candidate
+                limit = count
+            next_j = max(next_j, end_b)
+        j = next_j
+
+    if best is None:
+        return None
+    return best[2] - alo, best[3] - blo
+
+def _diff_ranges(a, alo, ahi, b, blo, bhi, opcodes, split):
+    """ Appends the opcodes for a[alo:ahi] -> b[blo:bhi] to opcodes. The
+        ranges are divided at the points returned by split() until they
+        are equal, empty or have nothing in common. """
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item[0], str):  # an opcode waiting for its turn
+            opcodes.append(item)
+            continue
+        alo, ahi, blo, bhi = item
+        prefix, suffix = _common_affixes(a, alo, ahi, b, blo, bhi)
+        if prefix:
+            opcodes.append(("equal", alo, alo + prefix, blo, blo + prefix))
+        if suffix:
+            stack.append(("equal", ahi - suffix, ahi, bhi - suffix, bhi))
+        alo += prefix
+        blo += prefix
+        ahi -= suffix
+        bhi -= suffix
+
+        if alo == ahi or blo == bhi:
+            opcodes.append(("delete" if blo == bhi else "insert", alo, ahi, blo, bhi))
+            continue
+        point = split(a, alo, ahi, b, blo, bhi)
+        if point is None or point == (0, 0) or point == (ahi - alo, bhi - blo):
+            opcodes.append(("replace", alo, ahi, blo, bhi))
+            continue
+        x, y = point
+        # (The left part is processed first, i.e. pushed last.)
+        stack.append((alo + x, ahi, blo + y, bhi))
+        stack.append((alo, alo + x, blo, blo + y))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Compares many pairs of page ranges (e.g. one original and several
+    censored editions) without user interaction. The pairs are read from a
+    manifest file, every document is normalized only once and both the
+    normalization and the comparisons run in parallel in pools of processes.
+
+    Usage: python batch_compare.py [OPTIONS] MANIFEST OUTPUT_DIR [EXPORT_DIR ...]
+
+    The manifest is a tab separated file with one comparison per line:
+
+        name        original_start          original_end            censored_start          censored_end
+        wild_1577   tr:37299.291391:430     tr:37299.291391:431     tr:37299.292113:717     tr:37299.292113:718
+
+    (original_end and censored_end may be empty for a single page.) If export
+    folders are given, the documents are read from them (cf. local_source.py);
+    otherwise they are downloaded from Transkribus (user name and password
+    are taken from the environment variables TRANSKRIBUS_USER and
+    TRANSKRIBUS_PASSWORD or asked for).
+
+    For every comparison, OUTPUT_DIR contains NAME.html (the differences),
+    NAME.diff.gz (the Diff_Result) and NAME.blocks.tsv (the passages most
+    likely censored, cf. censorship_detector.py). OUTPUT_DIR/summary.tsv
+    lists the finished comparisons.
+
+    The caches and the index which are kept between runs are written to
+    OUTPUT_DIR, unless other paths are given (python batch_compare.py --help):
+    dictionary_cache.json, normalized_cache/, corpus_index/ and page_cache/
+    (only if the pages are downloaded). """
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tools import IO_Tools
+from cts import Cts
+from cli import Transkribus_CLI
+from local_source import Local_Source
+from fetcher import Page_Fetcher
+from alignment import Alignment_Engine
+from word_stream import Vocabulary
+from diff_result import Diff_Result
+from diff_renderer import HTML_Renderer
+from censorship_detector import Censorship_Detector, BLOCK_FIELDS
+
+SUMMARY_FIELDS = ("name", "status", "opcodes", "deleted", "inserted", "seconds")
+
+def read_manifest(path):
+    """ Returns the comparisons of a manifest file as a list of dicts
+        {'name', 'original', 'censored'} with page range dicts (cf.
+        Transkribus_CLI.select_range_pipeline()). """
+    def page_range(start, end):
+        return {"start": Cts().from_string(start),
+                "end": Cts().from_string(end or start)}
+
+    jobs = []
+    for name, row in IO_Tools().replacement_table_from_file(path).items():
+        try:
+            jobs.append({'name': name,
+                         'original': page_range(row['original_start'], row.get('original_end')),
+                         'censored': page_range(row['censored_start'], row.get('censored_end'))})
+        except (KeyError, AttributeError):
+            sys.exit(f"BATCH: ERROR: Invalid manifest line: {name}")
+    return jobs
+
+def normalize_documents(cli, jobs):
+    """ Downloads and normalizes the pages needed by the jobs. Every page
+        is processed only once, even if it is part of several jobs.
+        Returns {(colId, docId): {pageNr: page}}. """
+    # The pages needed of each document:
+    needed = {}
+    for job in jobs:
+        for page_range in (job['original'], job['censored']):
+            key = (page_range['start'].colId, page_range['start'].docId)
+            first, last = int(page_range['start'].pageNr), int(page_range['end'].pageNr)
+            needed.setdefault(key, set()).update(range(first, last + 1))
+
+    documents = {}
+    for (colId, docId), pageNrs in needed.items():
+        print(f"BATCH: Normalizing {len(pageNrs)} pages of {colId}/{docId}...")
+        page_range = {"start": Cts().from_string(f"tr:{colId}.{docId}:{min(pageNrs)}"),
+                      "end": Cts().from_string(f"tr:{colId}.{docId}:{max(pageNrs)}")}
+        fetcher = Page_Fetcher(cli.client, [(colId, docId, str(pageNr)) for pageNr in sorted(pageNrs)],
+                               cli.executor, window=cli.prefetch)
+        documents[(colId, docId)] = {page['cts'].pageNr: page
+                                     for page in cli.get_pages(page_range, fetcher)}
+    return documents
+
+def select_pages(documents, page_range):
+    """ Returns the pages of a page range from the normalized documents. """
+    pages = documents[(page_range['start'].colId, page_range['start'].docId)]
+    first, last = int(page_range['start'].pageNr), int(page_range['end'].pageNr)
+    return [pages[str(pageNr)] for pageNr in range(first, last + 1) if str(pageNr) in pages]
+
+def compare_job(name, stream_1, stream_2, output_dir, algorithm="histogram", variants=False):
+    """ Compares two Word_Streams (in a worker process), writes NAME.html,
+        NAME.diff.gz and NAME.blocks.tsv to output_dir and returns a summary
+        dict. """
+    start = time.perf_counter()
+    # (The worker processes do not start processes of their own.)
+    aligner = Alignment_Engine(algorithm, processes=1, variants=variants)
+    result = Diff_Result(stream_1, stream_2)
+    with open(Path(output_dir) / f"{name}.html", "w", encoding="utf-8") as f:
+        HTML_Renderer(f).render(stream_1, stream_2,
+                                result.collect(aligner.iter_opcodes(stream_1, stream_2)))
+    result.save(Path(output_dir) / f"{name}.diff.gz")
+
+    blocks = Censorship_Detector().find(result)
+    with open(Path(output_dir) / f"{name}.blocks.tsv", "w", encoding="utf-8") as f:
+        f.write("\t".join(("rank",) + BLOCK_FIELDS) + "\n")
+        for rank, block in enumerate(blocks, 1):
+            row = block.to_dict()
+            row['score'], row['density'] = f"{block.score:.1f}", f"{block.density:.2f}"
+            f.write("\t".join([str(rank)] + [("" if row[field] is None else str(row[field])) for field in BLOCK_FIELDS]) + "\n")
+
+    deleted = inserted = 0
+    for tag, i1, i2, j1, j2 in zip(result.tags, result.i1, result.i2, result.j1, result.j2):
+        if tag:  # not 'equal'
+            deleted += i2 - i1
+            inserted += j2 - j1
+    return {'name': name, 'status': "OK", 'opcodes': len(result), 'deleted': deleted,
+            'inserted': inserted, 'seconds': f"{time.perf_counter() - start:.2f}"}
+
+def run_batch(manifest_path, output_dir, export_dirs=(), processes=None, cache_dir=None,
+              dictionary_cache_path=None, normalized_cache_path=None,
+              corpus_index_path=None, page_cache_path=None):
+    """ Runs all comparisons of a manifest file (cf. the module docstring).
+        The paths of the caches and the index default to files and folders
+        in cache_dir, which defaults to output_dir. """
+    jobs = read_manifest(manifest_path)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir = Path(cache_dir) if cache_dir else output_dir
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    paths = {'dictionary_cache_path': dictionary_cache_path or cache_dir / "dictionary_cache.json",
+             'normalized_cache_path': normalized_cache_path or cache_dir / "normalized_cache",
+             'corpus_index_path': corpus_index_path or cache_dir / "corpus_index"}
+
+    if export_dirs:
+        cli = Transkribus_CLI(client=Local_Source(*export_dirs), processes=processes, **paths)
+    else:
+        cli = Transkribus_CLI(page_cache_path=page_cache_path or cache_dir / "page_cache",
+                              processes=processes, **paths)
+        username = os.environ.get("TRANSKRIBUS_USER")
+        password = os.environ.get("TRANSKRIBUS_PASSWORD")
+        if not (username and password and cli.client.login(username, password)):
+            cli.login()
+
+    try:
+        documents = normalize_documents(cli, jobs)
+    finally:
+        cli.logout()
+
+    # All Word_Streams share one Vocabulary:
+    vocabulary = Vocabulary()
+    with open(output_dir / "summary.tsv", "w", encoding="utf-8") as summary, \
+         ProcessPoolExecutor(processes) as executor:
+        summary.write("\t".join(SUMMARY_FIELDS) + "\n")
+        futures = {}
+        for job in jobs:
+            stream_1 = cli.extract_words_from_pages(select_pages(documents, job['original']),
+                                                    breaks=True, vocabulary=vocabulary)
+            stream_2 = cli.extract_words_from_pages(select_pages(documents, job['censored']),
+                                                    vocabulary=vocabulary)
+            future = executor.submit(compare_job, job['name'], stream_1, stream_2, output_dir,
+                                     cli.aligner.algorithm, cli.aligner.variants)
+            futures[future] = job['name']
+
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            try:
+                row = future.result()
+                print(f"BATCH: [{done}/{len(jobs)}] {name}: {row['deleted']} words deleted, "
+                      f"{row['inserted']} words inserted ({row['seconds']} s).")
+            except Exception as e:
+                row = {'name': name, 'status': f"ERROR: {e}"}
+                print(f"BATCH: [{done}/{len(jobs)}] {name}: ERROR: {e}")
+            summary.write("\t".join(str(row.get(field, "")) for field in SUMMARY_FIELDS) + "\n")
+            summary.flush()
+    print(f"BATCH: Results written to {output_dir}.")
+
+def main():
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    parser = argparse.ArgumentParser(description="Compares the page ranges listed in a manifest.")
+    parser.add_argument("manifest")
+    parser.add_argument("output_dir")
+    parser.add_argument("export_dirs", nargs="*")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument("--cache-dir", help="folder of the caches and the index (default: OUTPUT_DIR)")
+    parser.add_argument("--dictionary-cache", help="path of the dictionary cache (json file)")
+    parser.add_argument("--normalized-cache", help="folder of the normalized pages")
+    parser.add_argument("--corpus-index", help="folder of the Corpus_Index")
+    parser.add_argument("--page-cache", help="folder of the downloaded page XML files")
+    args = parser.parse_args()
+    run_batch(args.manifest, args.output_dir, args.export_dirs, args.processes, args.cache_dir,
+              args.dictionary_cache, args.normalized_cache, args.corpus_index, args.page_cache)
+
+if __name__ == "__main__":
+    main()
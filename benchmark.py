@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Benchmarks for the normalization and comparison pipeline, using the
+    pages in Transkribus_Test_Data. Usage:
+
+        python benchmark.py                  -> run all benchmarks
+        python benchmark.py abbreviations    -> run selected benchmarks """
+
+import os
+import re
+import sys
+import random
+import difflib
+import time
+import threading
+import tracemalloc
+import tempfile
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import product
+from bisect import bisect_right
+from pathlib import Path
+from lxml import etree, objectify
+from tools import IO_Tools
+from replacement_engine import Replacement_Engine
+from transkribus_web import Transkribus_Web
+from page_parser import Page_Parser, get_custom_attributes
+from alignment import Alignment_Engine
+from page_model import Word, Line
+
+TEST_DATA = Path("Transkribus_Test_Data")
+REPLACEMENT_TABLE = "replacement_table.tsv"
+NS = "{http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15}"
+
+# Helper functions:
+
+def load_test_lines():
+    """ Returns the text of all TextLines in the bundled PAGE XML files. """
+    lines = []
+    for page_file in sorted(TEST_DATA.glob("*/page/*.xml")):
+        tree = etree.parse(str(page_file))
+        for unicode in tree.iterfind(f".//{NS}TextLine/{NS}TextEquiv/{NS}Unicode"):
+            lines.append(unicode.text or "")
+    return lines
+
+def timeit(func, repeat=5):
+    """ Runs func() several times and returns the best time in seconds and
+        the result of the last run. """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def report(name, old, new):
+    print(f"{name.ljust(40)} {old*1000:10.2f} ms {new*1000:10.2f} ms {old/new:8.1f}x")
+
+# Benchmarks:
+
+def legacy_replace_abbreviations(replacement_table, text):
+    """ The former implementation of Cleaner.replace_abbreviations(): one
+        re.sub() call per row of the replacement table. """
+    for pattern, replacement in replacement_table.items():
+        repl = replacement['replacement']
+        pattern = r"{}".format(pattern)
+
+        def func(match):
+            g = match.group()
+            if g.islower(): return repl.lower()
+            if g.istitle(): return repl.title()
+            if g.isupper(): return repl.upper()
+            return repl
+
+        text = re.sub(pattern, func, str(text), flags=re.IGNORECASE)
+    return text
+
+def bench_abbreviations(lines):
+    """ Cleaner.replace_abbreviations(): re.sub() per row vs. Replacement_Engine. """
+    table = IO_Tools().replacement_table_from_file(REPLACEMENT_TABLE)
+    engine = Replacement_Engine(table)
+    # Simulate a longer book by repeating the test pages:
+    book = lines * 20
+
+    old, expected = timeit(lambda: [legacy_replace_abbreviations(table, l) for l in book])
+    new, result = timeit(lambda: [engine.replace(l) for l in book])
+    if result != expected:
+        sys.exit("BENCHMARK: ERROR: Replacement_Engine output differs from re.sub().")
+    report(f"replace_abbreviations ({len(book)} lines)", old, new)
+
+def bench_literal_prefilter(lines):
+    """ Finding the rows of the replacement table whose literal occurs in a
+        line: one substring test per row vs. the Aho_Corasick automaton of
+        the Replacement_Engine, with the table and with a table enlarged by
+        rows for abbreviated words of the test pages. """
+    from collections import OrderedDict
+    from replacement_engine import fold
+    table = IO_Tools().replacement_table_from_file(REPLACEMENT_TABLE)
+    book = [fold(line) for line in lines * 20]
+    words = sorted({word for line in lines for word in line.split() if len(word) > 4})
+    rng = random.Random(1559)
+    big_table = OrderedDict(table)
+    while len(big_table) < 4 * len(table):
+        word = rng.choice(words)
+        abbreviation = word[:rng.randint(2, len(word) - 2)] + rng.choice("ꝑꝓꝗ") + word[-2:]
+        big_table[re.escape(abbreviation)] = {'replacement': word}
+
+    for name, rows in (("table", table), ("enlarged table", big_table)):
+        engine = Replacement_Engine(rows)
+        literals = [(index, rule.literal) for index, rule in enumerate(engine.rules) if rule.literal]
+
+        def substring_tests(folded):
+            return {index for index, literal in literals if literal in folded}
+
+        old, expected = timeit(lambda: [substring_tests(folded) for folded in book])
+        new, result = timeit(lambda: [engine.automaton.find(folded) for folded in book])
+        if result != expected:
+            sys.exit("BENCHMARK: ERROR: Aho_Corasick found other rows than the substring tests.")
+        report(f"find literals ({len(literals)} rows, {name})", old, new)
+
+def legacy_replace_macrons(dictionary, unresolved):
+    """ The former implementation of Cleaner.replace_macrons(): checks all
+        2^k combinations of m/n for k macrons. """
+    thisword = unresolved.lower()
+    replacements = {'ā': 'a', 'ē': 'e', 'ō': 'o', 'ū': 'u', 'ī': 'i'}
+    candidates = []
+    macrons = re.findall(r'[āēīōū]', thisword)
+    for e in product(['m', 'n'], repeat=len(macrons)):
+        new_word = thisword
+        for macron, mn in zip(macrons, e):
+            new_word = re.sub(macron, replacements[macron]+mn, new_word, count=1)
+        if dictionary.check_word(new_word):
+            candidates.append(new_word)
+    return candidates[0] if candidates else unresolved
+
+def bench_macrons(lines):
+    """ Cleaner.replace_macrons(): all combinations vs. pruned search.
+        The dictionary cache is cleared before every run. """
+    from cleaner import Cleaner
+    cleaner = Cleaner(REPLACEMENT_TABLE)
+    cleaner.dictionary.get_prefix_index()  # build the index in advance
+    words = [word['data'] for line in lines
+             for word in cleaner.tokenize(cleaner.replace_abbreviations(line))
+             if re.search(r'[āēīōū]', word['data'])]
+
+    def run(func):
+        cleaner.dictionary.cache.clear()
+        return [func(word) for word in words]
+
+    old, _ = timeit(lambda: run(lambda w: legacy_replace_macrons(cleaner.dictionary, w)))
+    new, _ = timeit(lambda: run(cleaner.replace_macrons))
+    report(f"replace_macrons ({len(words)} words)", old, new)
+
+class Stand_In_Handler(BaseHTTPRequestHandler):
+    """ A local stand-in for the Transkribus server which answers every GET
+        request with the same page XML (keeping the connection open). """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = b""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+def bench_session(lines, requests_count=200):
+    """ Transkribus_Web: a new connection per request vs. a pooled session,
+        against a local stand-in server. """
+    page_file = sorted(TEST_DATA.glob("*/page/*.xml"))[0]
+    Stand_In_Handler.body = page_file.read_bytes()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stand_In_Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    def without_session():
+        cookies = dict(JSESSIONID="benchmark")
+        return [objectify.fromstring(requests.get(f"{url}collections/1/2/{i}/text", cookies=cookies).content)
+                for i in range(requests_count)]
+
+    client = Transkribus_Web(api_base_url=url)
+    client._set_session_cookie("benchmark")
+
+    def with_session():
+        return [client.get_page_xml(1, 2, i) for i in range(requests_count)]
+
+    old, _ = timeit(without_session, repeat=3)
+    new, _ = timeit(with_session, repeat=3)
+    server.shutdown()
+    report(f"get_page_xml ({requests_count} requests)", old, new)
+
+def legacy_parse_page(content):
+    """ The former way of reading the lines of a page: an objectify tree,
+        getparent() and the custom attributes of the region for every line. """
+    page_xml = objectify.fromstring(content)
+    lines = []
+    for line in page_xml.Page.iter(f"{NS}TextLine"):
+        region = get_custom_attributes(line.getparent().attrib['custom'])
+        if region.get("type") == "paragraph":
+            lineNr = get_custom_attributes(line.attrib['custom'])['index']
+            lines.append((region['index'], lineNr, str(line.TextEquiv.Unicode)))
+    return lines
+
+def bench_parser(lines):
+    """ Reading the lines of a page: objectify tree vs. Page_Parser. """
+    pages = [page_file.read_bytes() for page_file in sorted(TEST_DATA.glob("*/page/*.xml"))] * 50
+
+    old, expected = timeit(lambda: [legacy_parse_page(page) for page in pages])
+    new, result = timeit(lambda: [list(Page_Parser(page)) for page in pages])
+    if result != expected:
+        sys.exit("BENCHMARK: ERROR: Page_Parser output differs from objectify.")
+    report(f"parse page XML ({len(pages)} pages)", old, new)
+
+def legacy_tokenize(text):
+    """ The former implementation of Cleaner.tokenize(): re.split() with a
+        pattern string (looked up in the cache of the re module for every
+        line), all words containing "#" are "unreadable". """
+    words = []
+    for input_word in re.split(r"([\s.,;:?\-=()\]])", text):
+        if input_word != " " and input_word != '':
+            if input_word in ".,;:?-=()]":
+                data_type = "punctuation"
+            elif "#" in input_word:
+                data_type = "unreadable"
+            else:
+                data_type = "word"
+            words.append(Word(data_type, input_word))
+    return words
+
+def bench_tokenize(lines):
+    """ Cleaner.tokenize(): re.split() with a pattern string vs. the
+        precompiled SEPARATORS pattern. """
+    from cleaner import Cleaner
+    cleaner = Cleaner(REPLACEMENT_TABLE)
+    book = [cleaner.replace_abbreviations(line) for line in lines] * 50
+
+    # (The results are compared afterwards: the Words of one tokenizer kept
+    # in memory would slow down the garbage collection while timing the other.)
+    old, _ = timeit(lambda: [legacy_tokenize(line) for line in book])
+    new, _ = timeit(lambda: [cleaner.tokenize(line) for line in book])
+    expected = [legacy_tokenize(line) for line in book]
+    result = [cleaner.tokenize(line) for line in book]
+    # (Partially unreadable words used to be "unreadable".)
+    for word in (word for line in result for word in line):
+        if word.data_type == "partially_unreadable":
+            word.data_type = "unreadable"
+    if result != expected:
+        sys.exit("BENCHMARK: ERROR: Cleaner.tokenize() output differs from the former implementation.")
+    report(f"tokenize ({len(book)} lines)", old, new)
+
+def bench_clean_lines(lines):
+    """ Cleaning the lines of a page: replace_abbreviations(), tokenize() and
+        resolve_macrons() line by line vs. Cleaner.clean_lines() for all
+        lines of the page. The dictionary cache is cleared before every run.
+        This checks that both give the same result; clean_lines() is not
+        expected to be faster (cf. Cleaner.clean_lines()). """
+    from cleaner import Cleaner
+    cleaner = Cleaner(REPLACEMENT_TABLE)
+    cleaner.dictionary.get_prefix_index()  # build the index in advance
+    pages = [[raw_data for regionNr, lineNr, raw_data in Page_Parser(page_file.read_bytes())]
+             for page_file in sorted(TEST_DATA.glob("*/page/*.xml"))] * 50
+
+    def line_by_line():
+        cleaner.dictionary.cache.clear()
+        result = []
+        for page in pages:
+            for raw_data in page:
+                cleaned = cleaner.replace_abbreviations(raw_data)
+                result.append((cleaned, cleaner.resolve_macrons(cleaner.tokenize(cleaned))))
+        return result
+
+    def by_page():
+        cleaner.dictionary.cache.clear()
+        return [line for page in pages for line in cleaner.clean_lines(page)]
+
+    old, _ = timeit(line_by_line)
+    new, _ = timeit(by_page)
+    if by_page() != line_by_line():
+        sys.exit("BENCHMARK: ERROR: Cleaner.clean_lines() output differs from line by line.")
+    report(f"clean lines, same output ({len(pages)} pages)", old, new)
+
+def bench_normalizer_pool(lines):
+    """ Cleaning pages in the main process vs. a Normalizer_Pool with one
+        process per CPU (including the start of the processes). The
+        dictionary cache is cleared before every run. With one CPU, the pool
+        cleans the pages in the main process, too (the times are the same). """
+    from cleaner import Cleaner
+    from normalizer_pool import Normalizer_Pool, normalize_page
+    cleaner = Cleaner(REPLACEMENT_TABLE)
+    cleaner.dictionary.get_prefix_index()  # build the index in advance
+    pages = [page_file.read_bytes() for page_file in sorted(TEST_DATA.glob("*/page/*.xml"))] * 100
+
+    def main_process():
+        cleaner.dictionary.cache.clear()
+        return [normalize_page(cleaner, page_xml) for page_xml in pages]
+
+    def run(processes):
+        cleaner.dictionary.cache.clear()
+        pool = Normalizer_Pool(cleaner, processes)
+        try:
+            return [result for pageNr, result in pool.normalize(enumerate(pages))]
+        finally:
+            pool.shutdown()
+
+    old, expected = timeit(main_process, repeat=3)
+    processes = os.cpu_count() or 1
+    new, result = timeit(lambda: run(processes), repeat=3 if processes == 1 else 1)
+    if [[line.to_dict() for line in page['lines']] for page, error in result] != \
+       [[line.to_dict() for line in page['lines']] for page, error in expected]:
+        sys.exit("BENCHMARK: ERROR: The pages cleaned by the Normalizer_Pool differ.")
+    report(f"normalize {len(pages)} pages ({processes} processes)", old, new)
+
+def bench_variants(lines):
+    """ Finding the spelling variants of words: bounded_levenshtein() with
+        every word of the vocabulary vs. the candidates of a Variant_Index. """
+    from spelling_variants import Variant_Index, bounded_levenshtein
+    vocabulary = sorted(set(" ".join(lines).split()))
+    # Words with one or two random edits (and some without any variant):
+    rng = random.Random(1577)
+    letters = "abcdefghilmnopqrstuxæ"
+    queries = []
+    for _ in range(2000):
+        word = list(rng.choice(vocabulary))
+        for _ in range(rng.randint(1, 2)):
+            position = rng.randrange(len(word) + 1)
+            operation = rng.choice(("insert", "delete", "replace"))
+            if operation == "insert" or not word:
+                word.insert(position, rng.choice(letters))
+            elif position < len(word):
+                word[position] = rng.choice(letters) if operation == "replace" else ""
+        queries.append("".join(word))
+    index = Variant_Index(vocabulary)
+
+    def all_pairs(word):
+        best, best_distance = None, index.max_distance + 1
+        for position, other in enumerate(vocabulary):
+            limit = min(index.limit(max(len(word), len(other))), best_distance - 1)
+            if limit < 0:
+                break
+            distance = bounded_levenshtein(word, other, limit)
+            if distance <= limit:
+                best, best_distance = position, distance
+        return best
+
+    old, expected = timeit(lambda: [all_pairs(word) for word in queries], repeat=1)
+    new, result = timeit(lambda: [index.find(word) for word in queries])
+    if result != expected:
+        sys.exit("BENCHMARK: ERROR: Variant_Index results differ from all pairs.")
+    report(f"find variants ({len(queries)} words, {len(vocabulary)} types)", old, new)
+
+def bench_page_model(lines):
+    """ Lines and tokens as dicts vs. slotted Line and Word objects: the time
+        to build and to read a simulated book and the memory it takes. """
+    engine = Replacement_Engine(IO_Tools().replacement_table_from_file(REPLACEMENT_TABLE))
+    book = [engine.replace(line) for line in lines] * 50
+    tokens = [[(("punctuation" if token in ".,;:?-=()]" else "word"), token)
+               for token in re.split(r"([\s.,;:?\-=()\]])", line) if token not in (" ", "")]
+              for line in book]
+
+    def build_dicts():
+        return [{'identifier': f"r0l{n}", 'raw_data': line, 'cleaned_data': line,
+                 'words': [{'data_type': data_type, 'data': data} for data_type, data in line_tokens]}
+                for n, (line, line_tokens) in enumerate(zip(book, tokens))]
+
+    def build_objects():
+        return [Line(f"r0l{n}", line, line, [Word(data_type, data) for data_type, data in line_tokens])
+                for n, (line, line_tokens) in enumerate(zip(book, tokens))]
+
+    def read_dicts(page):
+        return [word['data'] for line in page for word in line['words']
+                if word['data_type'] != "punctuation"]
+
+    def read_objects(page):
+        return [word.data for line in page for word in line.words
+                if word.data_type != "punctuation"]
+
+    def memory(build):
+        tracemalloc.start()
+        page = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size, page
+
+    old_size, old_page = memory(build_dicts)
+    new_size, new_page = memory(build_objects)
+    if read_dicts(old_page) != read_objects(new_page):
+        sys.exit("BENCHMARK: ERROR: Word objects differ from dicts.")
+    words = sum(map(len, tokens))
+    old, _ = timeit(build_dicts)
+    new, _ = timeit(build_objects)
+    report(f"build lines and tokens ({words} tokens)", old, new)
+    old, _ = timeit(lambda: read_dicts(old_page))
+    new, _ = timeit(lambda: read_objects(new_page))
+    report(f"read tokens ({words} tokens)", old, new)
+    print(f"{'memory of lines and tokens'.ljust(40)} {old_size/1024**2:10.2f} MB {new_size/1024**2:10.2f} MB "
+          f"{old_size/new_size:8.1f}x")
+
+def synthetic_editions(lines, words=20000, seed=1559):
+    """ Returns two synthetic "editions" of a book: words drawn at random
+        from the test lines (i.e. with their frequencies) and a censored copy
+        with removed passages, some inserted passages and words spelled
+        differently. """
+    vocabulary = " ".join(lines).split()
+    rng = random.Random(seed)
+    original = [rng.choice(vocabulary) for _ in range(words)]
+    censored = list(original)
+    for _ in range(words // 1000):
+        start = rng.randrange(len(censored))
+        del censored[start:start + rng.randint(5, 200)]
+    for _ in range(words // 2000):
+        start = rng.randrange(len(censored))
+        censored[start:start] = rng.sample(vocabulary, rng.randint(3, 30))
+    for _ in range(words // 200):
+        position = rng.randrange(len(censored))
+        censored[position] = censored[position] + "e"
+    return original, censored
+
+def bench_alignment(lines):
+    for words in (5000, 20000, 100000):
+        original, censored = synthetic_editions(lines, words)
+        old, _ = timeit(lambda: list(difflib.Differ().compare(original, censored)), repeat=1)
+        for algorithm, anchor_size in product(("histogram", "myers"), (0, 4)):
+            # (Myers' algorithm in pure Python is too slow for a whole book.)
+            if algorithm == "myers" and anchor_size == 0 and words > 20000:
+                continue
+            aligner = Alignment_Engine(algorithm, anchor_size=anchor_size)
+            new, opcodes = timeit(lambda: aligner.opcodes(original, censored), repeat=3)
+            result = []
+            for tag, i1, i2, j1, j2 in opcodes:
+                result += original[i1:i2] if tag == "equal" else censored[j1:j2]
+            if result != censored:
+                sys.exit(f"BENCHMARK: ERROR: {algorithm} alignment is not valid.")
+            name = f"{algorithm}, anchors" if anchor_size else algorithm
+            report(f"align {words} words ({name})", old, new)
+
+def bench_page_matcher(lines):
+    """ Finding the pages of a censored edition matching a page range of the
+        original: the shared shingles of all pages vs. the MinHash sketches
+        of a Page_Index. """
+    from page_matcher import Page_Index, best_range, shingles
+    original, censored = synthetic_editions(lines, 300000)
+    original_pages = [original[i:i + 300] for i in range(0, len(original), 300)]
+    censored_pages = [censored[i:i + 250] for i in range(0, len(censored), 250)]
+    index = Page_Index()
+    for pageNr, words in enumerate(censored_pages, 1):
+        index.add_page(pageNr, words)
+    page_shingles = [shingles(words, index.shingle_size) for words in censored_pages]
+    queries = [[word for page in original_pages[first:first + 20] for word in page]
+               for first in range(0, len(original_pages) - 20, 100)]
+
+    def exact_match(words):
+        query = shingles(words, index.shingle_size)
+        return best_range(index.pageNrs, [len(page & query) / len(page) if page else None
+                                          for page in page_shingles], index.threshold)
+
+    old, expected = timeit(lambda: [exact_match(words) for words in queries], repeat=1)
+    new, result = timeit(lambda: [index.match(words) for words in queries], repeat=3)
+    if result != expected:
+        print(f"BENCHMARK: WARNING: The estimated ranges differ: {result} vs. {expected}")
+    report(f"match page ranges ({len(queries)} x {len(index)} pages)", old, new)
+
+def bench_corpus_index(lines):
+    """ Searching phrases in several editions: scanning their words vs. the
+        postings of a Corpus_Index. """
+    from corpus_index import Corpus_Index
+    from cts import Cts
+    original, censored = synthetic_editions(lines, 100000)
+    editions = [original, censored] + [synthetic_editions(lines, 100000, seed=seed)[1]
+                                       for seed in (1577, 1582)]
+    rng = random.Random(1559)
+    phrases = []
+    for _ in range(50):
+        start = rng.randrange(len(original) - 5)
+        phrases.append(original[start:start + rng.randint(2, 5)])
+
+    def scan(phrase):
+        found = []
+        for number, words in enumerate(editions):
+            first, size = phrase[0], len(phrase)
+            for position, word in enumerate(words):
+                if word == first and words[position:position + size] == phrase:
+                    found.append((number, position))
+        return found
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = Corpus_Index(directory)
+        starts = []
+        for number, words in enumerate(editions, 1):
+            # One line of 250 words per page:
+            for pageNr, start in enumerate(range(0, len(words), 250), 1):
+                line = Line("r0l0", "", "", [Word("word", word) for word in words[start:start + 250]])
+                if pageNr == 1:
+                    starts.append(index.size + (1 if index.size else 0))
+                index.add_page({'lines': [line], 'cts': Cts().from_string(f"tr:1.{number}:{pageNr}")})
+        index.commit()
+
+        def search(phrase):
+            found = []
+            for position in index.find(phrase):
+                number = bisect_right(starts, position) - 1
+                found.append((number, position - starts[number]))
+            return found
+
+        old, expected = timeit(lambda: [scan(phrase) for phrase in phrases], repeat=1)
+        new, result = timeit(lambda: [search(phrase) for phrase in phrases])
+        index.close()
+    # (The index does not distinguish upper and lower case.)
+    if any(not set(e).issubset(r) for e, r in zip(expected, result)):
+        sys.exit("BENCHMARK: ERROR: Corpus_Index did not find all phrases.")
+    report(f"find phrases ({len(phrases)} x {len(editions)} editions)", old, new)
+
+BENCHMARKS = {"abbreviations": bench_abbreviations,
+              "literal_prefilter": bench_literal_prefilter,
+              "macrons": bench_macrons,
+              "session": bench_session,
+              "parser": bench_parser,
+              "tokenize": bench_tokenize,
+              "clean_lines": bench_clean_lines,
+              "normalizer_pool": bench_normalizer_pool,
+              "alignment": bench_alignment,
+              "variants": bench_variants,
+              "page_matcher": bench_page_matcher,
+              "corpus_index": bench_corpus_index,
+              "page_model": bench_page_model}
+
+def main():
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    lines = load_test_lines()
+    print(f"{'benchmark'.ljust(40)} {'before'.rjust(13)} {'after'.rjust(13)} {'speedup'.rjust(9)}")
+    for name in selected:
+        BENCHMARKS[name](lines)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Censorship_Detector object which collapses the opcodes of
+    a comparison into passages and ranks them as suspected censorship. """
+
+import sys
+import heapq
+
+BLOCK_FIELDS = ("score", "density", "deleted", "inserted", "start_1", "end_1", "start_2", "end_2")
+
+class Censorship_Block:
+    """ A passage of consecutive differences: list_1[i1:i2] was replaced by
+        list_2[j1:j2]. deleted and inserted are the numbers of words which
+        differ (without the equal words in between), density is their share
+        of all words of the block and score = (deleted + inserted) *
+        density. start_1/end_1 and start_2/end_2 are the Cts addresses of
+        the first and the last word in both editions (None if the span is
+        empty, e.g. for a passage deleted completely). """
+
+    __slots__ = ("i1", "i2", "j1", "j2", "deleted", "inserted", "density", "score",
+                 "start_1", "end_1", "start_2", "end_2")
+
+    def __init__(self, i1, i2, j1, j2, deleted, inserted, start_1, end_1, start_2, end_2):
+        self.i1, self.i2, self.j1, self.j2 = i1, i2, j1, j2
+        self.deleted = deleted
+        self.inserted = inserted
+        self.density = block_density(i1, i2, j1, j2, deleted, inserted)
+        self.score = (deleted + inserted) * self.density
+        self.start_1, self.end_1 = start_1, end_1
+        self.start_2, self.end_2 = start_2, end_2
+
+    def __repr__(self):
+        return (f"<Censorship_Block {self.score:.1f} {self.start_1}–{self.end_1} -> "
+                f"{self.start_2}–{self.end_2}: -{self.deleted} +{self.inserted}>")
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+class Censorship_Detector:
+    """ Censored passages show up in the opcodes of an alignment as long
+        deletions (or replacements) or as many small differences close to
+        each other, e.g. a sentence rewritten word by word. Both are hard to
+        find in a diff of thousands of words, so the Censorship_Detector
+        merges the opcodes which are separated by no more than max_gap equal
+        words into blocks and ranks the blocks by their score (the number of
+        differing words times their density, cf. Censorship_Block).
+
+            detector = Censorship_Detector()
+            for block in detector.find(result, top=10):
+                print(block.score, block.start_1, block.end_1)
+
+        The blocks are built in one pass over the opcodes; only the top
+        blocks are kept (in a heap) and get Cts addresses.
+
+        max_gap -- the maximum number of equal words within a block """
+
+    def __init__(self, max_gap=3):
+        self.max_gap = max_gap
+
+    def blocks(self, opcodes):
+        """ Eats opcodes (tag, i1, i2, j1, j2), e.g. a generator, and yields
+            the blocks as (i1, i2, j1, j2, deleted, inserted) tuples. """
+        block = None
+        gap = 0   # equal words since the last difference of the block
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal":
+                if block is not None:
+                    gap += i2 - i1
+                    if gap > self.max_gap:
+                        yield tuple(block)
+                        block = None
+                continue
+            if block is None:
+                block = [i1, i2, j1, j2, i2 - i1, j2 - j1]
+            else:
+                block[1], block[3] = i2, j2
+                block[4] += i2 - i1
+                block[5] += j2 - j1
+            gap = 0
+        if block is not None:
+            yield tuple(block)
+
+    def find(self, result, top=10):
+        """ Eats a Diff_Result (cf. diff_result.py) and returns its top
+            blocks as a list of Censorship_Blocks with the highest score
+            first (of blocks with the same score, the first one in the
+            text). """
+        best = heapq.nlargest(top, self.blocks(result.opcodes()),
+                              key=lambda block: (block[4] + block[5]) * block_density(*block))
+        stream_1, stream_2 = result.stream_1, result.stream_2
+        return [Censorship_Block(i1, i2, j1, j2, deleted, inserted,
+                                 stream_1.address(i1) if i1 < i2 else None,
+                                 stream_1.address(i2 - 1) if i1 < i2 else None,
+                                 stream_2.address(j1) if j1 < j2 else None,
+                                 stream_2.address(j2 - 1) if j1 < j2 else None)
+                for i1, i2, j1, j2, deleted, inserted in best]
+
+# Helper functions:
+
+def block_density(i1, i2, j1, j2, deleted, inserted):
+    """ Returns the share of the differing words of all words of a block. """
+    return (deleted + inserted) / ((i2 - i1) + (j2 - j1))
+
+def print_blocks(blocks, file=None):
+    """ Writes a list of Censorship_Blocks as a ranking (default: to the
+        terminal). """
+    file = file if file is not None else sys.stdout
+    if not blocks:
+        print("No suspected censorship found.", file=file)
+        return
+    print("Suspected censorship:", file=file)
+    for rank, block in enumerate(blocks, 1):
+        print(f"{rank:>3}. {block.start_1 or '-'} – {block.end_1 or '-'}: "
+              f"{block.deleted} words deleted, {block.inserted} words inserted "
+              f"(density {block.density:.0%}, score {block.score:.1f})", file=file)
+        if block.start_2:
+            print(f"     censored edition: {block.start_2} – {block.end_2}", file=file)
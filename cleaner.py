@@ -2,21 +2,58 @@
 # -*- coding: utf-8 -*-
 
 import re
+import hashlib
 from pathlib import Path
 from tools import IO_Tools
 from dictionary import Dictionary
-from itertools import product
+from replacement_engine import Replacement_Engine, LINE_SEPARATOR
+from page_model import Word
+
+# Vowels with macrons and their replacements:
+MACRONS = {'ā': 'a',
+           'ē': 'e',
+           'ō': 'o',
+           'ū': 'u',
+           'ī': 'i'}
+# Marks macrons that could not be resolved, e.g. "dā" -> "da●":
+UNRESOLVABLE = str.maketrans({k: v+'●' for k, v in MACRONS.items()})
+# Splits a line into tokens, keeping the separators (cf. Cleaner.tokenize()):
+SEPARATORS = re.compile(r"([\s.,;:?\-=()\]])")
+# The same for several lines joined with LINE_SEPARATOR (cf. Cleaner.tokenize_lines()):
+LINE_SEPARATORS = re.compile(r"([\s.,;:?\-=()\]\x00])")
+# A token containing "#" (an unreadable character) is "unreadable" if it
+# contains no readable letter or digit, otherwise "partially_unreadable":
+UNREADABLE = re.compile(r"[\W_]+")
+# Increase this number whenever a change of the cleaning functions changes
+# their results (the normalized pages cached on the disk become invalid):
+NORMALIZATION_VERSION = 3
 
 class Cleaner:
 
-    def __init__(self, replacement_table_path):
+    def __init__(self, replacement_table_path, dictionary_cache_path=None):
         self.replacement_table_path = Path(replacement_table_path)
-        self.dictionary = Dictionary()
+        # The dictionary caches its results. If dictionary_cache_path is given,
+        # the cache is kept on disk between runs (cf. dictionary.py):
+        self.dictionary = Dictionary(cache_path=dictionary_cache_path)
 
         # Load the replacement table (you can load the replacement table from a csv/tsv file
         # or remotely from a Google sheet. Take a look at tools.py to understand the details!):
         tools = IO_Tools()
         self.replacement_table = tools.replacement_table_from_file(self.replacement_table_path)
+        # Compile the replacement table once (cf. replacement_engine.py):
+        self.replacement_engine = Replacement_Engine(self.replacement_table)
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """ Returns a hash of everything the results of the Cleaner depend on:
+            the replacement table, the hunspell dictionary and
+            NORMALIZATION_VERSION (cf. normalized_cache.py). """
+        if self._fingerprint is None:
+            sha = hashlib.sha1(f"{NORMALIZATION_VERSION}\n".encode())
+            sha.update(self.replacement_table_path.read_bytes())
+            sha.update(self.dictionary.fingerprint().encode())
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
 
     def replace_abbreviations(self, text):
         """ Normalizes Latin spelling (u/v, i/j).
@@ -26,120 +63,170 @@ class Cleaner:
             replace abbreviations.
             Returns the cleaned text. """  
 
-        for pattern, replacement in self.replacement_table.items():
-            repl = replacement['replacement']
-
-            pattern = r"{}".format(pattern) # convert the pattern to a raw string
-                                            # (otherwise "\b" does not work!!)
-
-            # Helper function to preserve the case of the original text:
-            def func(match):
-                g = match.group()
-                if g.islower(): return repl.lower()
-                if g.istitle(): return repl.title()
-                if g.isupper(): return repl.upper()
-                return repl
-
-            text = re.sub(pattern, func, str(text), flags=re.IGNORECASE)
-
-        return text
+        return self.replacement_engine.replace(text)
 
     def tokenize(self, text):
         """ Eats a string containing the normalized text.
             Tokenizes the string separating letters and punctuation.
-            Returns a list of word objects, i.e. dictionaries.
+            Returns a list of Word objects (cf. page_model.py) with the
+            data_type "word", "punctuation", "unreadable" or
+            "partially_unreadable".
             To distinguish correctly between words and punctuation, 
             the abbreviations in the text have to be resolved 
             /before/ the tokenization. """
 
         words = []
-        for input_word in re.split("([\s.,;:?\-=()\]])", text):
+        for input_word in SEPARATORS.split(text):
             # This pattern generates some empty elements that have
             # to be filtered out. 
             if input_word != " " and input_word != '': 
                 if input_word in ".,;:?-=()]":
                     data_type = "punctuation"
-                elif "#" in input_word:  
-                    # TODO könnte man verbessern: wenn das Wort außer
-                    # "#" noch lesbare Buchstaben enthält, ist es nicht
-                    # gänzlich "unreadable".
-                    data_type = "unreadable"
+                elif "#" in input_word:
+                    # E.g. "##" is unreadable, "Chri#tus" is not
+                    # entirely unreadable.
+                    if UNREADABLE.fullmatch(input_word):
+                        data_type = "unreadable"
+                    else:
+                        data_type = "partially_unreadable"
                 else:
                     data_type = "word"
 
-                if data_type != "word":
-                    words.append({'data_type': data_type,
-                                  'data': input_word})
-                else:
-                    words.append({'data_type': data_type,
-                                  'data': input_word})
+                words.append(Word(data_type, input_word))
 
         return words
 
+    def tokenize_lines(self, lines):
+        """ Does the same as tokenize() for a list of strings, but splits
+            all of them at once (joined with LINE_SEPARATOR, which cannot
+            occur in the text of a page XML). Returns a list of lists of
+            Words, one per line. """
+        text = LINE_SEPARATOR.join(lines)
+        if text.count(LINE_SEPARATOR) != len(lines) - 1:
+            return [self.tokenize(line) for line in lines]
+
+        words = []
+        words_of_lines = [words]
+        for input_word in LINE_SEPARATORS.split(text):
+            if input_word != " " and input_word != '':
+                if input_word in ".,;:?-=()]":
+                    data_type = "punctuation"
+                elif input_word == LINE_SEPARATOR:
+                    words = []
+                    words_of_lines.append(words)
+                    continue
+                elif "#" in input_word:
+                    if UNREADABLE.fullmatch(input_word):
+                        data_type = "unreadable"
+                    else:
+                        data_type = "partially_unreadable"
+                else:
+                    data_type = "word"
+
+                words.append(Word(data_type, input_word))
+
+        return words_of_lines
+
     def resolve_macrons(self, words):
-        """ Resolve the macrons for a list of words (which are dicts), 
+        """ Resolve the macrons for a list of Words, 
             except the first and last word. Those will be 
             checked later while resolving the line breaks. """
+        for word in self.macron_words(words):
+            word.data = self.replace_macrons(word.data)
+        return words
+
+    @staticmethod
+    def macron_words(words):
+        """ Returns the Words of a line whose macrons are resolved by
+            resolve_macrons(), i.e. the words except the first and the
+            last word. """
             
         # Search for the last word in the line (avoiding punctuation, unreadable, etc.)
-        if words[-1]['data_type'] == "word":
+        if words[-1].data_type == "word":
             offset = -1
         elif len(words) > 1:
-            if words[-1]['data_type'] != "word" and words[-2]['data_type'] != "word":
+            if words[-1].data_type != "word" and words[-2].data_type != "word":
                 offset = -3
-            elif words[-1]['data_type'] != "word":
+            elif words[-1].data_type != "word":
                 offset = -2            
         else:
-            return words
+            return []
 
-        # Resolve the macrons now:
-        for word in words[1:offset]:
-            if word['data_type'] == "word":
-                word['data'] = self.replace_macrons(word['data'])
-        return words
+        return [word for word in words[1:offset] if word.data_type == "word"]
+
+    def clean_lines(self, lines):
+        """ Eats a list of strings (the raw text of the lines of a page or
+            of a whole document). Does the same as replace_abbreviations(),
+            tokenize() and resolve_macrons() for every line, but for all
+            lines at once:
+            – the literals of the replacement table are searched in all
+              lines together (cf. Replacement_Engine.replace_lines()),
+            – the lines are tokenized in one pass (cf. tokenize_lines()),
+            – every distinct word is looked up in the dictionary only once
+              and the results are written back to all its occurrences.
+            It is not faster than cleaning line by line (cf. benchmark.py
+            clean_lines): the rows of the replacement table still run on
+            single lines, because running them on the joined lines is
+            slower (cf. Replacement_Engine.replace_lines()).
+            Returns a list of (cleaned, words) tuples, one per line. """
+        cleaned_lines = self.replacement_engine.replace_lines(lines)
+        words_of_lines = self.tokenize_lines(cleaned_lines)
+
+        candidates = [word for words in words_of_lines for word in self.macron_words(words)]
+        resolved = {data: self.replace_macrons(data)
+                    for data in dict.fromkeys(word.data for word in candidates)}
+        for word in candidates:
+            word.data = resolved[word.data]
+
+        return list(zip(cleaned_lines, words_of_lines))
 
     def replace_macrons(self, unresolved):
         """ Eats the string of a word and replaces macrons with 'n' or 'm' 
             after checking self.dictionary for the correct replacement. 
             It returns the resolved word. If there are no macrons in the word 
             it returns the input. If no solution was found it resolves the 
-            macron as '●' so that you can resolve it manually. """
+            macron as '●' so that you can resolve it manually. 
+            
+            The macrons are resolved from left to right. For every macron,
+            the more frequent combination (e.g. "um" before "q") is tried 
+            first, and combinations that cannot be the beginning of any word 
+            in the dictionary are dropped at once. The first combination 
+            which is in the dictionary is returned. """
         
         thisword = unresolved.lower()
-        replacements = {'ā': 'a',
-                        'ē': 'e',
-                        'ō': 'o',
-                        'ū': 'u',
-                        'ī': 'i'}
-        mns = ['m', 'n']
-        candidates = []
-        # Get a list of all vocals with macrons in this word:
-        macrons = re.findall(r'[āēīōū]', thisword)
-        if len(macrons) != 0:
-            # Generate lists with all possible replacement comibinations:
-            # (https://www.geeksforgeeks.org/python-extract-combination-mapping-in-two-lists/)
-            combinations = list(list(zip(macrons, e)) for e in product(mns, repeat=len(macrons)))
-            # For every combination, ask the dictionary if the word exists:
-            for c in combinations:
-                new_word = thisword
-                # perform all the replacements suggested in this combination:
-                for pair in c:
-                    new_word = re.sub(pair[0], replacements[pair[0]]+pair[1], new_word, count=1)
-                # if the new word exists, add it to the list of candidates:
-                exists = self.dictionary.check_word(new_word)
-                if exists: 
-                    candidates.append(new_word)
-            if len(candidates) != 0:
-                # if there are candidates: return the first candidate:
-                return candidates[0]
-            else:
-                # if there are no candidates: replace the macron with "●":
-                for k,v in replacements.items():
-                    unresolvable = re.sub(k, v+'●', unresolved)
-                return unresolvable
-        else:
+        # Get the positions of all vocals with macrons in this word:
+        positions = [i for i, c in enumerate(thisword) if c in MACRONS]
+        if len(positions) == 0:
             return unresolved
 
+        index = self.dictionary.get_prefix_index()
+
+        def search(k, head):
+            """ Resolves the k-th macron. head is the part of the word 
+                before the k-th macron with all macrons resolved. """
+            if k == len(positions):
+                return self.dictionary.check_word(head + thisword[positions[-1]+1:])
+            position = positions[k]
+            start = positions[k-1] + 1 if k > 0 else 0
+            vowel = MACRONS[thisword[position]]
+            following = thisword[position+1:position+2]
+            following = MACRONS.get(following, following)
+            for mn in index.mn_order(vowel, following):
+                new_head = head + thisword[start:position] + vowel + mn
+                # (The last macron is checked with the whole word anyway.)
+                if k + 1 == len(positions) or index.could_start(new_head):
+                    found = search(k+1, new_head)
+                    if found:
+                        return found
+            return False
+
+        resolved = search(0, "")
+        if resolved:
+            return resolved
+        else:
+            # if there are no candidates: replace the macrons with "●":
+            return unresolved.translate(UNRESOLVABLE)
+
     def resolve_linebreaks(self, page):
         """ Eats a page. Inspects the first and the last word of every
             line on the page and decides whether the last word of a line 
@@ -241,7 +328,7 @@ class Cleaner:
             empty after having moved words during resolving linebreaks.
             
             yes_no        -- a boolean whether the words should be joined or not
-            thisLine      -- line object (i.e. a dict) 
+            thisLine      -- line object (cf. page_model.py)
             thisWordIndex -- the index of the last word (-1 or -2)
             nextLine      -- line object
             message       -- a message (string) for logging. """
@@ -280,8 +367,7 @@ class Cleaner:
                 # insert one empty word as a dummy:
                 if len(nextLine['words']) == 0:
                     print("CLEANER: !! Line", nextLine['identifier'], "is EMPTY after resolving hyphenation.")
-                    nextLine['words'].insert(0, {'data_type': 'empty',
-                                                 'data': ''})                
+                    nextLine['words'].insert(0, Word('empty', ''))                
                 # If the new composite word was followed by a punctuation:
                 # move the punctuation to the end of thisLine.
                 if nextLine['words'][0]['data_type'] == "punctuation":
@@ -290,8 +376,7 @@ class Cleaner:
                 # And again: make sure the next line has at least one "empty" word.
                 if len(nextLine['words']) == 0:
                     print("CLEANER: !! Line", nextLine['identifier'], "is EMPTY after resolving hyphenation.")
-                    nextLine['words'].insert(0, {'data_type': 'empty',
-                                                 'data': ''})
+                    nextLine['words'].insert(0, Word('empty', ''))
 
         return thisLine
            
@@ -5,7 +5,18 @@ from os import EX_DATAERR
 from transkribus_web import Transkribus_Web
 from cleaner import Cleaner
 from cts import Cts
-import re
+from fetcher import Page_Fetcher
+from page_cache import Page_Cache
+from normalized_cache import Normalized_Cache
+from document_normalizer import Document_Normalizer
+from normalizer_pool import Normalizer_Pool, normalize_page
+from alignment import Alignment_Engine
+from word_stream import Vocabulary, Word_Stream
+from diff_renderer import Terminal_Renderer
+from diff_result import Diff_Result
+from page_matcher import Page_Index
+from corpus_index import Corpus_Index
+from concurrent.futures import ThreadPoolExecutor
 import sys
 from pprint import pprint
 
@@ -13,10 +24,40 @@ class Transkribus_CLI:
     """ A very simple command line interface (CLI) to operate the Transkribus_Web client 
         and a pipeline which normalizes a diplomatic transcription of Latin text. 
         Caveats: No handling of erroneus user input and no possibility to go one step back. """
-    def __init__(self):
-        # Initialize the Transkribus_Web object:
-        self.client = Transkribus_Web()
-        self.cleaner = Cleaner(replacement_table_path = "replacement_table.tsv")
+    def __init__(self, dictionary_cache_path=None, page_cache_path=None, max_requests=4, prefetch=8,
+                 client=None, alignment="histogram", fuzzy=False, normalized_cache_path=None,
+                 processes=1, variants=False, corpus_index_path=None):
+        # Initialize the Transkribus_Web object
+        # (if page_cache_path is given, downloaded pages are kept on the disk).
+        # Instead, you can pass another client, e.g. a Local_Source object
+        # reading Transkribus exports from the disk (cf. local_source.py):
+        if client is None:
+            page_cache = Page_Cache(page_cache_path) if page_cache_path else False
+            client = Transkribus_Web(pool_size=max_requests, cache=page_cache)
+        self.client = client
+        # Pages are downloaded in the background with max_requests requests
+        # in flight and up to prefetch pages per page range in advance:
+        self.executor = ThreadPoolExecutor(max_workers=max_requests)
+        self.prefetch = prefetch
+        self.cleaner = Cleaner(replacement_table_path = "replacement_table.tsv",
+                               dictionary_cache_path = dictionary_cache_path)
+        # If normalized_cache_path is given, the normalized pages are kept on the
+        # disk and unchanged pages are not cleaned again (cf. normalized_cache.py):
+        self.normalized_cache = (Normalized_Cache(normalized_cache_path, self.cleaner.fingerprint())
+                                 if normalized_cache_path else False)
+        # If corpus_index_path is given, the words of all normalized pages are
+        # added to an inverted index on the disk (cf. corpus_index.py):
+        self.corpus_index = Corpus_Index(corpus_index_path) if corpus_index_path else False
+        # The pages are cleaned by this number of processes (None = number of
+        # CPUs, cf. normalizer_pool.py):
+        self.normalizer_pool = Normalizer_Pool(self.cleaner, processes)
+        # Resolves the line breaks between the pages (cf. document_normalizer.py):
+        self.document_normalizer = Document_Normalizer(self.cleaner)
+        # The algorithm used to compare two editions (cf. alignment.py).
+        # With variants=True, spelling variants count as equal words:
+        self.aligner = Alignment_Engine(alignment, fuzzy=fuzzy, variants=variants)
+        # The Page_Index of every document searched by match_range() (cf. page_matcher.py):
+        self.page_indexes = {}
             
     def login(self):
         YOUR_USER_NAME = input("Transkribus user name: ")
@@ -63,17 +104,15 @@ class Transkribus_CLI:
             and let the user choose a page. Note that only pages with
             status FINAL or GT (Ground Truth) are listed (FINAL in 
             parenthesis). """
-        my_pages = self.client.get_pages_in_document(colId, docId)
+        my_pages = self.final_pages(colId, docId)
 
         if my_pages:
             page_list = []
-            for page in my_pages:
-                # Select only those pages with status FINAL or GT (Ground Truth):
-                status = page['tsList']['transcripts'][0]['status']
+            for pageNr, status in my_pages:
                 if status == "FINAL":
-                    page_list.append(f"({page['pageNr']})")
-                elif status == "GT":
-                    page_list.append(f"{page['pageNr']}")
+                    page_list.append(f"({pageNr})")
+                else:
+                    page_list.append(f"{pageNr}")
 
             print()
             print(" ".join(page_list)) # Print the list of pages in this document.
@@ -117,92 +156,159 @@ class Transkribus_CLI:
         return {"start": Cts().from_string(f"tr:{colId}.{docId}:{pageNr_start}"),
                 "end": Cts().from_string(f"tr:{colId}.{docId}:{pageNr_end}")}
 
-    def check_for_errors(self, page_xml):
-        """ Helper function. Make sure that the page_xml contains
-            – TextRegions
-            – Baselines
-            – TextEquiv, i.e. actual text in the lines. 
-            This is useful for further processing of the data to prevent crashes.
-            
-            page_xml -- a lxml.objectify object of a page in Transkribus 
-            
-            Returns False if everything is OK, otherwise an error message. """
-            
-        ns = "{http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15}"
-        
-        if page_xml.find(f".//{ns}TextRegion") is None:
-            return "PAGE-XML: ERROR: No TextRegions found."
-        if page_xml.find(f".//{ns}Baseline") is None:
-            return "PAGE-XML: ERROR: No BaseLines found."
-        if page_xml.find(f".//{ns}TextEquiv") is None:
-            return "PAGE-XML: ERROR: Lines contain no text."
-
-        return False
-
-    def get_custom_attributes(self, string):
-        """ Helper function. Returns the custom attributes of a TextRegion as a dict. """
-        custom_attributes = re.compile(r'\{(\w*?):(\w*?);\}')
-        return dict(custom_attributes.findall(string))
+    def select_matching_range_pipeline(self, page_range):
+        """ Lets the user choose a document and finds the pages matching a
+            page range (cf. match_range()). If no pages match, the user
+            selects the page range by hand.
+            Returns a dict with two Cts objects (start, end)."""
+        colId = self.choose_collection()
+        docId = self.choose_document(colId)
+        print("Searching the matching pages...")
+        matching_range = self.match_range(page_range, colId, docId)
+        if matching_range is None:
+            print("No matching pages found. Please, select the page range by hand.")
+            return self.select_range_pipeline()
+        print(f"Found {matching_range['start'].to_string()}–{matching_range['end'].pageNr}.")
+        return matching_range
+
+    def final_pages(self, colId, docId):
+        """ Returns a list of (pageNr, status) tuples of the pages of a
+            document with status FINAL or GT (Ground Truth). """
+        my_pages = self.client.get_pages_in_document(colId, docId) or []
+        return [(page['pageNr'], page['tsList']['transcripts'][0]['status'])
+                for page in my_pages
+                if page['tsList']['transcripts'][0]['status'] in ("FINAL", "GT")]
+
+    def index_document(self, colId, docId):
+        """ Normalizes the pages of a document with status FINAL or GT and
+            returns a Page_Index of them (cf. page_matcher.py). Pages that
+            cannot be downloaded or contain no text are skipped. The pages
+            are not added to the corpus index. """
+        index = Page_Index()
+        pageNrs = [pageNr for pageNr, status in self.final_pages(colId, docId)]
+        if not pageNrs:
+            return index
+        page_range = {"start": Cts().from_string(f"tr:{colId}.{docId}:{pageNrs[0]}"),
+                      "end": Cts().from_string(f"tr:{colId}.{docId}:{pageNrs[-1]}")}
+        pages = [(colId, docId, str(pageNr)) for pageNr in pageNrs]
+        fetcher = Page_Fetcher(self.client, pages, self.executor, window=self.prefetch)
+        index.add_pages(self.iter_pages(page_range, fetcher, skip_errors=True, index=False))
+        return index
+
+    def match_range(self, page_range, colId, docId):
+        """ Eats a page range dict (e.g. of the original edition) and returns
+            the page range dict of the pages of another document (e.g. of a
+            repaginated censored edition) containing the same text or None
+            if no pages match. The pages of the other document are
+            normalized and indexed once (cf. index_document()); further page
+            ranges are matched in a fraction of a second. """
+        key = (str(colId), str(docId))
+        if key not in self.page_indexes:
+            self.page_indexes[key] = self.index_document(colId, docId)
+        pages = self.page_indexes[key].match_pages(self.iter_pages(page_range, index=False))
+        if pages is None:
+            return None
+        first, last = pages
+        return {"start": Cts().from_string(f"tr:{colId}.{docId}:{first}"),
+                "end": Cts().from_string(f"tr:{colId}.{docId}:{last}")}
 
     def get_page(self, colId, docId, pageNr):
         """ Download the page_xml data from Transkribus and process
             the text of a page. Returns an error if the page 
             does not contain TextRegions, BaseLines or actual text in 
             the lines. Otherwise, it returns a page object (i.e. a dict). """
-        # Store the namespace string used by the Transkribus page_xml format:
-        ns = "{http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15}"
-        
-        my_page = self.client.get_page_xml(colId, docId, pageNr)
-        
-        check_for_errors = self.check_for_errors(my_page)
-        if check_for_errors:
+        my_page = self.client.get_page_raw(colId, docId, pageNr)
+        return self.process_page(my_page, colId, docId, pageNr)
+
+    def process_page(self, my_page, colId, docId, pageNr):
+        """ Process the text of a downloaded page (page XML as bytes, 
+            cf. get_page()). """
+        page = self.cached_page(my_page, colId, docId, pageNr)
+        if page is not None:
+            return page
+        page, error = normalize_page(self.cleaner, my_page)
+        return self.store_page(my_page, page, error, colId, docId, pageNr)
+
+    def cached_page(self, my_page, colId, docId, pageNr):
+        """ Returns the page object of a page normalized before with the same
+            replacement table and dictionary or None (cf. process_page()). """
+        if my_page is False:
             self.logout()
-            sys.exit(f"ERROR processing {colId}/{docId}, page {pageNr}: {check_for_errors}")
-        else:
-            # Extract the lines of my_page and build a page object:
-            page = {"lines": []}
-            for line in my_page.Page.iter(f"{ns}TextLine"): # Cf. the section "tree iteration" in https://lxml.de/tutorial.html
-                # Get the attributes of the TextRegion:
-                custom_attributes_region = self.get_custom_attributes(line.getparent().attrib['custom'])
-                regionNr = custom_attributes_region['index']
-                # In the following line you could filter TextRegions tagged with a specific tag (like "paragraph"):
-                if custom_attributes_region.get("type") == "paragraph": # Filter all TextRegions tagged as "paragraph".
-                    lineNr = self.get_custom_attributes(line.attrib['custom'])['index']
-                    # Build a line object
-                    raw_data = line.TextEquiv.Unicode
-                    cleaned = self.cleaner.replace_abbreviations(raw_data)
-                    words = self.cleaner.tokenize(cleaned)
-                    words = self.cleaner.resolve_macrons(words)
-                    new_line = {'identifier': f"r{regionNr}l{lineNr}",
-                                'raw_data': raw_data,
-                                'cleaned_data': cleaned,
-                                'words': words}
-                    page["lines"].append(new_line)
-
-            # Resolve linebreaks on this page:
-            page = self.cleaner.resolve_linebreaks(page)
+            sys.exit(f"ERROR processing {colId}/{docId}, page {pageNr}: Download failed.")
 
-            return page
+        if self.normalized_cache:
+            return self.normalized_cache.get(my_page)
+        return None
 
-    def get_pages(self, page_range):
+    def store_page(self, my_page, page, error, colId, docId, pageNr):
+        """ Eats the result of normalize_page() for a page XML. Exits if the
+            page contained no TextRegions, BaseLines or text. Otherwise, the
+            page object is stored in the cache and returned. """
+        if error:
+            self.logout()
+            sys.exit(f"ERROR processing {colId}/{docId}, page {pageNr}: {error}")
+
+        if self.normalized_cache:
+            self.normalized_cache.store(my_page, page)
+        return page
+
+    def fetch_pages(self, page_range):
+        """ Start downloading the page_xml data for a page range in the 
+            background. Returns a Page_Fetcher object. """
+        colId = page_range['start'].colId
+        docId = page_range['start'].docId
+        first = int(page_range['start'].pageNr)
+        last = int(page_range['end'].pageNr)
+        pages = [(colId, docId, str(pageNr)) for pageNr in range(first, last + 1)]
+        return Page_Fetcher(self.client, pages, self.executor, window=self.prefetch)
+
+    def get_pages(self, page_range, fetcher=None):
         """ Download the page_xml data for a sequence of pages
             from Transkribus and process the text of a pages. 
-            Returns a list of page objects (i.e. dicts). """
-
-        pages = []
-        range_length = int(page_range['end'].pageNr) - int(page_range['start'].pageNr) + 1
-        for this_page in range(range_length):
-            pageNr = str(int(page_range['start'].pageNr) + this_page)
-            page = self.get_page(colId = page_range['start'].colId, 
-                                 docId = page_range['start'].docId, 
-                                 pageNr = pageNr)
-            cts = page_range['start']
-            cts.pageNr = pageNr
-            cts.passage = pageNr
-            page['cts'] = cts
-            pages.append(page)
-
-        return pages
+            Returns a list of page objects (i.e. dicts). 
+            The next pages are downloaded while a page is processed. 
+            fetcher -- a Page_Fetcher for this page range (if the download
+                       has already been started with fetch_pages()). """
+
+        return list(self.iter_pages(page_range, fetcher))
+
+    def iter_pages(self, page_range, fetcher=None, skip_errors=False, index=True):
+        """ Like get_pages(), but yields the page objects one by one. The
+            line breaks between the pages are resolved while the pages
+            arrive (cf. document_normalizer.py), so only the current and
+            the previous page are kept in memory.
+            skip_errors -- skip pages that cannot be downloaded or contain
+                           no text instead of exiting
+            index       -- add the pages to the corpus index (if any) """
+
+        if fetcher is None:
+            fetcher = self.fetch_pages(page_range)
+        colId = page_range['start'].colId
+        docId = page_range['start'].docId
+
+        def pages_to_clean():
+            for pageNr, my_page in fetcher:
+                if my_page is False and skip_errors:
+                    print(f"Skipping {colId}/{docId}, page {pageNr}: Download failed.")
+                    continue
+                page = self.cached_page(my_page, colId, docId, pageNr)
+                yield (pageNr, my_page, page), (my_page if page is None else None)
+
+        def processed_pages():
+            # The pages are cleaned by the normalizer pool (in order):
+            for (pageNr, my_page, page), result in self.normalizer_pool.normalize(pages_to_clean()):
+                if page is None and skip_errors and result[1]:
+                    print(f"Skipping {colId}/{docId}, page {pageNr}: {result[1]}")
+                    continue
+                if page is None:
+                    page = self.store_page(my_page, *result, colId, docId, pageNr)
+                page['cts'] = Cts().from_string(f"tr:{colId}.{docId}:{pageNr}")
+                yield page
+
+        for page in self.document_normalizer.normalize(processed_pages()):
+            if index and self.corpus_index:
+                self.corpus_index.add_page(page)
+            yield page
 
     def print_page(self, page, raw_text=False):
         """ Prints a page object to the command line. """
@@ -219,63 +325,75 @@ class Transkribus_CLI:
         page = self.get_page(cts.colId, cts.docId, cts.pageNr)
         self.print_page(page, raw_text=False)      
 
-    def extract_words_from_pages(self, pages, breaks=False):
-        word_list = []
+    def extract_words_from_pages(self, pages, breaks=False, vocabulary=None):
+        """ Eats a list of pages and returns their words (without punctuation)
+            as a Word_Stream with the Cts address of every line. If breaks is
+            True, the page and line breaks are added as markers. Pass the
+            same Vocabulary for editions which are compared with each other. """
+        word_stream = Word_Stream(vocabulary)
         for page in pages:
+            page_cts = page['cts'].to_string()
             if breaks:
-                word_list.append(f"$${page['cts'].to_string()}")  # Add a page break
+                word_stream.add_marker(page_cts)  # Add a page break
             for line in page['lines']:
                 if breaks:
-                    word_list.append(f"$${line['identifier']}")   # Add a line break
-                for word in line['words']:
-                    if word['data_type'] != "punctuation":
-                        word_list.append(word['data'])
-        return word_list
-
-    def compare_word_lists(self, list_1, list_2):
-        import difflib
-
-        d = difflib.Differ()
-        delta = d.compare(list_1, list_2)  # returns a generator
-        delta = [*delta]  # converts the generator into a list
-
-        # Functions providing markup with combining unicode characters
-        def strikethrough(text):
-            return ''.join([u'\u0336{}'.format(c) for c in text])
-
-        def underline(text):
-            return ''.join([u'\u0332{}'.format(c) for c in text])
-
-        # Process the differences found with difflib:
-        output = []
-        for line in delta:
-            # Extract the code and the data from each line:
-            code = line[:1]
-            data = line[2:]
-
-            # Add markup:
-            if data.startswith("$$"):
-                output.append(f"\n{data[2:]}")
-            else:
-                if code == " ":
-                    output.append(data)
-                elif code == "-":
-                    output.append(strikethrough(data))
-                elif code == "+":
-                    output.append(underline(data))
-
-        print(" ".join(output))
-
-    def compare_pipeline(self, page_range_original, page_range_censored):
+                    word_stream.add_marker(line.identifier)   # Add a line break
+                word_stream.add_line(f"{page_cts}.{line.identifier}", page['cts'].pageNr)
+                for word in line.words:
+                    if word.data_type != "punctuation":
+                        word_stream.append(word.data)
+        return word_stream
+
+    def compare_word_lists(self, list_1, list_2, renderer=None):
+        """ Eats two Word_Streams (or lists of words) and writes list_1 with
+            the differences while they are aligned. By default, they are
+            printed: deleted words are struck through, inserted words are
+            underlined, the markers of list_1 start a new line. Pass another
+            renderer (cf. diff_renderer.py) to write JSON lines or HTML, or
+            renderer=False to write nothing.
+            Returns the differences as a Diff_Result (cf. diff_result.py). """
+        if not isinstance(list_1, Word_Stream):
+            list_1 = Word_Stream.from_words(list_1)
+        if not isinstance(list_2, Word_Stream):
+            list_2 = Word_Stream.from_words(list_2, list_1.vocabulary)
+        result = Diff_Result(list_1, list_2)
+        opcodes = result.collect(self.aligner.iter_opcodes(list_1, list_2))
+        if renderer is False:
+            for _ in opcodes:
+                pass
+        else:
+            if renderer is None:
+                renderer = Terminal_Renderer()
+            renderer.render(list_1, list_2, opcodes)
+        return result
+
+    def compare_pipeline(self, page_range_original, page_range_censored, renderer=None):
         """ Eats a two page range dicts containing two Cts objects (start, end) produced
-            by the select_range_pipeline() function. """
-        original_pages = self.get_pages(page_range_original)
-        censored_pages = self.get_pages(page_range_censored)
+            by the select_range_pipeline() function. The differences are written by
+            the renderer (default: printed, cf. compare_word_lists()).
+            Returns the differences as a Diff_Result. """
+        # Download both page ranges at the same time:
+        original_fetcher = self.fetch_pages(page_range_original)
+        censored_fetcher = self.fetch_pages(page_range_censored)
+        original_pages = self.get_pages(page_range_original, original_fetcher)
+        censored_pages = self.get_pages(page_range_censored, censored_fetcher)
         
-        original_words = self.extract_words_from_pages(original_pages, breaks=True)
-        censored_words = self.extract_words_from_pages(censored_pages)
+        vocabulary = Vocabulary()
+        original_words = self.extract_words_from_pages(original_pages, breaks=True, vocabulary=vocabulary)
+        censored_words = self.extract_words_from_pages(censored_pages, vocabulary=vocabulary)
 
-        self.compare_word_lists(original_words, censored_words)
+        return self.compare_word_lists(original_words, censored_words, renderer)
 
     def logout(self):
+        self.executor.shutdown(wait=False)
+        self.normalizer_pool.shutdown()
         self.client.logout()
+        if self.client.cache:
+            self.client.cache.save()
+        if self.normalized_cache:
+            print(f"NORMALIZED: {self.normalized_cache.hits} pages from the cache, "
+                  f"{self.normalized_cache.misses} pages normalized.")
+        if self.corpus_index:
+            self.corpus_index.close()
+            print(f"CORPUS: {len(self.corpus_index.pages)} pages in the index.")
+        self.cleaner.dictionary.save_cache()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Corpus_Index object which keeps an inverted index of the
+    normalized words of all pages on the disk, so that phrases can be
+    searched in all editions without comparing them again.
+
+    Usage: python corpus_index.py DIRECTORY PHRASE """
+
+import sys
+import json
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from replacement_engine import fold
+from word_stream import pack_array, unpack_array
+
+class Corpus_Index:
+    """ An on-disk inverted index: every word (case insensitive, cf.
+        replacement_engine.fold()) is mapped to the positions of its
+        occurrences in all pages added so far.
+
+            index = Corpus_Index("corpus_index")
+            index.add_pages(cli.iter_pages(page_range))
+            index.commit()
+            index.documents("ut in ecclesia")  -> {"tr:37299.291391": ["tr:37299.291391:430.r0l3@7", ...]}
+
+        Every word of a page gets a position (the words of all pages are
+        numbered consecutively). The line index records the Cts address of
+        every line like Word_Stream, so a position can be turned into the
+        address of a word, e.g. "tr:37299.291391:430.r0l3@7" (the same
+        addresses as in a Diff_Result). The words of a page which does not
+        follow the last page added are separated by a gap, so phrases are
+        not found across two documents.
+
+        The positions of a word (its postings) are stored as the
+        differences between them in variable-length integers (7 bits per
+        byte), i.e. mostly one byte per occurrence. Every commit() writes a
+        new segment (directory/segments/NNNNN.postings and NNNNN.terms.json)
+        with the pages added since the last commit, so the index grows
+        incrementally and old segments are never rewritten. The postings
+        files are memory-mapped: a query only reads the postings of its
+        words. directory/index.json holds the line index and the list of
+        segments and is replaced after the segment has been written.
+
+        A page is added only once (by its Cts), even if it has been
+        normalized again with another replacement table. Delete the
+        directory to rebuild the index.
+
+        directory -- the directory of the index (created if necessary) """
+
+    def __init__(self, directory="corpus_index"):
+        self.directory = Path(directory)
+        self.segment_directory = self.directory / "segments"
+        self.segment_directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.json"
+
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            self.segments = stored['segments']          # names of the segments
+            self.size = stored['size']                  # the next position
+            self.last_page = stored['last_page']        # Cts of the last page added
+            self.pages = set(stored['pages'])           # Cts of all pages added
+            self.line_starts = unpack_array(stored['line_starts'])
+            self.line_labels = stored['line_labels']
+        except (OSError, ValueError, KeyError):
+            self.segments = []
+            self.size = 0
+            self.last_page = None
+            self.pages = set()
+            self.line_starts = array('I')
+            self.line_labels = []
+
+        self.terms = []     # the terms of every segment: term -> [offset, length]
+        self.postings = []  # the memory-mapped postings of every segment
+        for name in self.segments:
+            self._open_segment(name)
+        self.pending = {}   # term -> array of the positions added since the last commit
+
+    # Internal helper functions:
+
+    def _open_segment(self, name):
+        with open(self.segment_directory / f"{name}.terms.json", "r", encoding="utf-8") as f:
+            self.terms.append(json.load(f))
+        with open(self.segment_directory / f"{name}.postings", "rb") as f:
+            self.postings.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'segments': self.segments,
+                       'size': self.size,
+                       'last_page': self.last_page,
+                       'pages': sorted(self.pages),
+                       'line_starts': pack_array(self.line_starts),
+                       'line_labels': self.line_labels}, f, ensure_ascii=False)
+        tmp_path.replace(self.index_path)
+
+    # Public functions:
+
+    def add_page(self, page):
+        """ Adds the words (without punctuation, cf.
+            Transkribus_CLI.extract_words_from_pages()) of a page object
+            with Cts. Returns False if the page has been added before. """
+        cts = page['cts']
+        page_cts = cts.to_string()
+        if page_cts in self.pages:
+            return False
+        # A gap between pages which do not follow each other:
+        previous = f"{cts.namespace}:{cts.work}:{int(cts.pageNr) - 1}"
+        if self.last_page != previous and self.size:
+            self.size += 1
+
+        pending = self.pending
+        position = self.size
+        for line in page['lines']:
+            self.line_starts.append(position)
+            self.line_labels.append(f"{page_cts}.{line.identifier}")
+            for word in line.words:
+                if word.data_type != "punctuation":
+                    term = fold(word.data)
+                    positions = pending.get(term)
+                    if positions is None:
+                        positions = pending[term] = array('I')
+                    positions.append(position)
+                    position += 1
+        self.size = position
+        self.pages.add(page_cts)
+        self.last_page = page_cts
+        return True
+
+    def add_pages(self, pages):
+        """ Adds page objects (e.g. a generator) and commits them. Returns
+            the number of pages added. """
+        added = sum(1 for page in pages if self.add_page(page))
+        self.commit()
+        return added
+
+    def commit(self):
+        """ Writes the pages added since the last commit as a new segment. """
+        if not self.pending:
+            # (Pages without words change the line index only.)
+            self._save_index()
+            return
+        name = f"{len(self.segments):05d}"
+        terms = {}
+        with open(self.segment_directory / f"{name}.postings", "wb") as f:
+            offset = 0
+            for term in sorted(self.pending):
+                data = encode_postings(self.pending[term])
+                f.write(data)
+                terms[term] = [offset, len(data)]
+                offset += len(data)
+        with open(self.segment_directory / f"{name}.terms.json", "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+        self.pending = {}
+        self.segments.append(name)
+        self._open_segment(name)
+        self._save_index()
+
+    def positions(self, word):
+        """ Returns the positions of a word (sorted, as array('I')). Words
+            added after the last commit are not found. """
+        term = fold(word)
+        positions = array('I')
+        # The segments hold increasing positions, so their postings can be appended:
+        for terms, postings in zip(self.terms, self.postings):
+            entry = terms.get(term)
+            if entry is not None:
+                offset, length = entry
+                positions.extend(decode_postings(postings[offset:offset + length]))
+        return positions
+
+    def find(self, phrase):
+        """ Returns the positions of the first words of all occurrences of a
+            phrase (a string or a list of words). The rarest word is looked
+            up first; the positions of the other words are checked by
+            bisection. """
+        words = phrase.split() if isinstance(phrase, str) else list(phrase)
+        if not words:
+            return []
+        postings = [(self.positions(word), offset) for offset, word in enumerate(words)]
+        postings.sort(key=lambda entry: len(entry[0]))
+        rarest, rarest_offset = postings[0]
+        starts = [position - rarest_offset for position in rarest if position >= rarest_offset]
+        for positions, offset in postings[1:]:
+            if not starts:
+                break
+            starts = [start for start in starts if contains(positions, start + offset)]
+        return starts
+
+    def address(self, position):
+        """ Returns the Cts address (string) of a position, e.g.
+            "tr:123.456:1.r0l0@3" (cf. Word_Stream.address()). """
+        line = bisect_right(self.line_starts, position) - 1
+        if line < 0:
+            return None
+        return f"{self.line_labels[line]}@{position - self.line_starts[line]}"
+
+    def documents(self, phrase):
+        """ Returns the addresses of all occurrences of a phrase grouped by
+            document: {"tr:colId.docId": [address, ...]}. """
+        found = {}
+        for position in self.find(phrase):
+            address = self.address(position)
+            found.setdefault(address.rsplit(":", 1)[0], []).append(address)
+        return found
+
+    def close(self):
+        """ Commits the pages added and closes the memory-mapped files. """
+        self.commit()
+        for postings in self.postings:
+            postings.close()
+        self.postings = []
+        self.terms = []
+
+# Helper functions:
+
+def encode_postings(positions):
+    """ Returns sorted positions as bytes: the differences between them as
+        variable-length integers (7 bits per byte, the highest bit is set in
+        all bytes but the last one of a number). """
+    data = bytearray()
+    previous = 0
+    for position in positions:
+        delta = position - previous
+        previous = position
+        while delta >= 0x80:
+            data.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+def decode_postings(data):
+    """ Returns the positions (array('I')) encoded by encode_postings(). """
+    positions = array('I')
+    position = delta = shift = 0
+    for byte in data:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            position += delta
+            positions.append(position)
+            delta = shift = 0
+    return positions
+
+def contains(positions, position):
+    """ Returns True if a sorted array contains a position. """
+    index = bisect_left(positions, position)
+    return index < len(positions) and positions[index] == position
+
+def print_documents(index, phrase):
+    """ Prints the occurrences of a phrase in a Corpus_Index by document. """
+    found = index.documents(phrase)
+    if not found:
+        print(f"CORPUS: \"{phrase}\" not found in {len(index.pages)} pages.")
+    for document, addresses in found.items():
+        print(f"{document}: {len(addresses)} occurrences")
+        for address in addresses:
+            print(f"  {address}")
+
+def main():
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    index = Corpus_Index(sys.argv[1])
+    print_documents(index, " ".join(sys.argv[2:]))
+    index.close()
+
+if __name__ == "__main__":
+    main()
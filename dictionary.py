@@ -1,22 +1,263 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import json
+import bisect
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
 from hunspell import Hunspell
 
 class Dictionary:
     """ Latin dictionary built with cyhunspell: https://pypi.org/project/cyhunspell/.
         Dictionary.check_word(word) checks a single word (string) and returns True or False.
-        Needs the Latin Hunspell dictionary by Karl Zeiler and Jean-Pierre Sutto 
-        from https://latin-dict.github.io/docs/hunspell-la.zip  ↓↓↓↓  """
-    def __init__(self):
-        self.hunspell = Hunspell('la_LA', hunspell_data_dir='hunspell-la')
+        Needs the Latin Hunspell dictionary by Karl Zeiler and Jean-Pierre Sutto
+        from https://latin-dict.github.io/docs/hunspell-la.zip  ↓↓↓↓
+
+        The results of hunspell (positive and negative) are kept in a LRU cache:
+        cache_size -- maximum number of words in the cache (None = no limit)
+        cache_path -- optional path to a json file. If given, the cache is loaded
+                      from this file and can be saved with save_cache() so that
+                      the next run does not have to ask hunspell again. """
+    def __init__(self, cache_size=100000, cache_path=None, language="la_LA", data_dir="hunspell-la"):
+        self.language = language
+        self.data_dir = Path(data_dir)
+        self.hunspell = Hunspell(language, hunspell_data_dir=str(self.data_dir))
+
+        self.prefix_index = None  # built on demand, cf. get_prefix_index()
+
+        self.cache_size = cache_size
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # If new_words is a dict, the results of hunspell are also recorded
+        # there (e.g. to pass them from a worker process to the main process,
+        # cf. normalizer_pool.py and merge_cache()):
+        self.new_words = None
+        if self.cache_path:
+            self.load_cache()
 
     def check_word(self, word):
-        """ Eats a word (string) and checks whether it is in the dictionary. 
+        """ Eats a word (string) and checks whether it is in the dictionary.
             Returns True/False. """
-        if self.hunspell.spell(word):
+        try:
+            known = self.cache[word]
+            self.cache.move_to_end(word)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            known = bool(self.hunspell.spell(word))
+            self.cache[word] = known
+            if self.new_words is not None:
+                self.new_words[word] = known
+            if self.cache_size is not None and len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)  # evict the least recently used word
+
+        if known:
             return word
         else:
             return False
 
+    def get_prefix_index(self):
+        """ Returns the Prefix_Index of the hunspell dictionary. It is built
+            the first time it is needed (this takes a second or two). """
+        if self.prefix_index is None:
+            self.prefix_index = Prefix_Index(self.data_dir / f"{self.language}.dic",
+                                             self.data_dir / f"{self.language}.aff")
+        return self.prefix_index
+
+    def merge_cache(self, words):
+        """ Adds the results of hunspell looked up elsewhere (a dict: word ->
+            True/False, e.g. the new_words of another process) to the cache. """
+        for word, known in words.items():
+            self.cache[word] = known
+            self.cache.move_to_end(word)
+        if self.cache_size is not None:
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def cache_info(self):
+        """ Returns the hits, misses and the current size of the cache as a dict. """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.cache),
+                'max_size': self.cache_size}
+
+    def fingerprint(self):
+        """ Returns a hash of the hunspell files (.dic and .aff). Cached results
+            are only valid as long as the fingerprint does not change. """
+        sha = hashlib.sha1()
+        for suffix in (".dic", ".aff"):
+            with open(self.data_dir / f"{self.language}{suffix}", "rb") as f:
+                sha.update(f.read())
+        return sha.hexdigest()
+
+    def load_cache(self):
+        """ Loads the cache from self.cache_path. The file is ignored if it
+            was built with another version of the hunspell dictionary. """
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if stored.get('fingerprint') != self.fingerprint():
+            print("DICTIONARY: INFO: The hunspell dictionary has changed. Ignoring the cache.")
+            return False
+
+        for word, known in stored['words'].items():
+            self.cache[word] = known
+        if self.cache_size is not None:
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        print(f"DICTIONARY: Loaded {len(self.cache)} words from {self.cache_path}.")
+        return True
+
+    def save_cache(self):
+        """ Saves the cache to self.cache_path (in LRU order). """
+        if not self.cache_path:
+            return False
+
+        stored = {'fingerprint': self.fingerprint(),
+                  'words': self.cache}
+        tmp_path = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stored, f, ensure_ascii=False)
+        tmp_path.replace(self.cache_path)
+        print(f"DICTIONARY: Saved {len(self.cache)} words to {self.cache_path}.")
+        return True
+
+
+class Prefix_Index:
+    """ Answers the question "Is there any word in the hunspell dictionary
+        that starts with this prefix?" without asking hunspell. It is built
+        from the .dic file (the stems) and the suffix rules (SFX) of the
+        .aff file: a word is a stem, or a stem minus the "strip" part of a
+        suffix rule plus the "add" part of the rule.
+
+        The index is generous: it ignores the conditions of the suffix rules
+        and the case of the stems, i.e. it may accept a prefix that does
+        not lead to any word, but it never rejects a prefix of a word that
+        hunspell would accept. The input conversions (ICONV, e.g. "inp" →
+        "imp") are applied before the lookup.
+
+        Besides, it counts how often "m" and "n" follow a vowel in the stems
+        (e.g. "um" + "q" vs. "un" + "q"). The counts are used to try the more
+        frequent resolution of a macron first. At the end of a word, "m" is
+        always tried first (cf. mn_order()). """
+
+    def __init__(self, dic_path, aff_path):
+        self.enabled = True
+        self.iconv = {}
+        self.mn_counts = {}
+
+        # Read the suffix rules: flag -> [(strip, index of the group of the
+        # prefixes of all "add" parts of the rules with this strip)]:
+        rules = {}
+        with open(aff_path, "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 5 and fields[0] == "SFX":
+                    strip = "" if fields[2] == "0" else fields[2].lower()
+                    add = "" if fields[3] == "0" else fields[3].split("/")[0].lower()
+                    rules.setdefault(fields[1], {}).setdefault(strip, set()).add(add)
+                elif len(fields) >= 5 and fields[0] == "PFX":
+                    # Prefix rules are not supported. Accept every prefix:
+                    self.enabled = False
+                elif len(fields) == 3 and fields[0] == "ICONV":
+                    self.iconv[fields[1]] = fields[2]
+
+        self.groups = [frozenset([""])]  # group 0: the stem itself
+        suffixes = {}
+        for flag, strips in rules.items():
+            suffixes[flag] = []
+            for strip, adds in strips.items():
+                self.groups.append(frozenset(add[:i] for add in adds for i in range(len(add)+1)))
+                suffixes[flag].append((strip, len(self.groups) - 1))
+
+        # Read the stems: truncated stem -> indices of groups of suffixes:
+        stems = {}
+        with open(dic_path, "r", encoding="utf-8") as f:
+            next(f)  # the first line contains the number of stems
+            for line in f:
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                stem, _, flags = line.partition("/")
+                stem = stem.lower()
+                self.count_mn(stem)
+                stems.setdefault(stem, set()).add(0)
+                for flag in flags:
+                    for strip, group in suffixes.get(flag, ()):
+                        if stem.endswith(strip):
+                            stems.setdefault(stem[:len(stem)-len(strip)], set()).add(group)
+
+        self.stems = {stem: tuple(groups) for stem, groups in stems.items()}
+        self.sorted_stems = sorted(self.stems)
+
+        # All proper prefixes of the ICONV patterns (cf. convert()):
+        self.iconv_heads = {pattern[:i] for pattern in self.iconv for i in range(1, len(pattern))}
+        self.iconv_max = max(map(len, self.iconv), default=0)
+
+    def count_mn(self, stem):
+        """ Counts the combinations vowel + m/n + following character in a stem. """
+        for i, c in enumerate(stem[1:], 1):
+            if (c == "m" or c == "n") and stem[i-1] in "aeiouy":
+                key = (stem[i-1], c, stem[i+1:i+2])
+                self.mn_counts[key] = self.mn_counts.get(key, 0) + 1
+
+    def mn_order(self, vowel, following):
+        """ Returns ("m", "n") or ("n", "m"), the more frequent combination
+            of vowel + m/n + following character first. At the end of a
+            word (following == ""), the counts of the stems are misleading:
+            the endings "-um", "-em", "-am" of the inflected forms are not in
+            the stems (e.g. "idē" must be "idem", not "iden"). So "m" comes
+            first there. """
+        if not following:
+            return ("m", "n")
+        m = self.mn_counts.get((vowel, "m", following), 0)
+        n = self.mn_counts.get((vowel, "n", following), 0)
+        return ("n", "m") if n > m else ("m", "n")
+
+    def convert(self, text):
+        """ Applies the ICONV rules like hunspell does (longest match first).
+            Returns None if the result depends on characters after the end of
+            the text, i.e. if an ICONV pattern could start at the end of text. """
+        if not self.iconv:
+            return text
+        output = []
+        i = 0
+        while i < len(text):
+            if text[i:] in self.iconv_heads:
+                return None
+            for length in range(min(self.iconv_max, len(text) - i), 0, -1):
+                replacement = self.iconv.get(text[i:i+length])
+                if replacement is not None:
+                    output.append(replacement)
+                    i += length
+                    break
+            else:
+                output.append(text[i])
+                i += 1
+        return "".join(output)
+
+    def could_start(self, prefix):
+        """ Returns False if no word in the dictionary starts with the prefix
+            (lower case), otherwise True. """
+        if not self.enabled:
+            return True
+        prefix = self.convert(prefix)
+        if prefix is None:
+            return True
 
+        # Is the prefix part of a (truncated) stem?
+        i = bisect.bisect_left(self.sorted_stems, prefix)
+        if i < len(self.sorted_stems) and self.sorted_stems[i].startswith(prefix):
+            return True
+        # Does the prefix consist of a stem and the beginning of a suffix?
+        for j in range(1, len(prefix)):
+            groups = self.stems.get(prefix[:j])
+            if groups and any(prefix[j:] in self.groups[g] for g in groups):
+                return True
+        return False
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the renderers which write the differences between two editions
+    to the terminal, to a JSON lines file or to an HTML file while they
+    are being aligned. """
+
+import sys
+import json
+import html
+
+class Diff_Renderer:
+    """ Writes the opcodes of an alignment (cf. alignment.py) of two lists of
+        words to a file, hunk by hunk. The subclasses define the format.
+
+        A hunk is a part of an opcode between two markers (e.g. the words of
+        an opcode on one line). Every hunk is written as soon as its opcode
+        has been aligned, so the output of long comparisons appears
+        continuously and nothing but the current hunk is kept in memory.
+
+        file -- a file object opened for writing text (default: sys.stdout) """
+
+    def __init__(self, file=None):
+        self.file = file if file is not None else sys.stdout
+
+    def render(self, list_1, list_2, opcodes):
+        """ Eats two Word_Streams (or lists of words) and their opcodes
+            (e.g. a generator) and writes them. The markers of list_1
+            are written before the words they belong to. """
+        self.begin()
+        marker_list = list_1.markers if hasattr(list_1, "markers") else lambda *args: iter(())
+        for tag, i1, i2, j1, j2 in opcodes:
+            start = i1
+            for position, label in marker_list(i1, i2):
+                if position > start:
+                    self.hunk(tag, start, position, j1, j1, list_1[start:position], [])
+                    start = position
+                self.marker(label, position)
+            words_2 = list_2[j1:j2] if tag != "equal" else []
+            if i2 > start or j2 > j1:
+                self.hunk(tag, start, i2, j1, j2, list_1[start:i2], words_2)
+        for position, label in marker_list(len(list_1)):
+            self.marker(label, position)
+        self.end()
+
+    # The functions defining the format:
+
+    def begin(self):
+        pass
+
+    def marker(self, label, position):
+        """ Writes a marker (e.g. a page or line break) of list_1. """
+        pass
+
+    def hunk(self, tag, i1, i2, j1, j2, words_1, words_2):
+        """ Writes the words list_1[i1:i2] = words_1 and (if tag is not
+            'equal') the words list_2[j1:j2] = words_2 replacing them. """
+        pass
+
+    def end(self):
+        self.file.flush()
+
+class Terminal_Renderer(Diff_Renderer):
+    """ Writes the words of list_1 separated by spaces. Deleted words are
+        struck through, inserted words are underlined (with combining
+        unicode characters). Every marker starts a new line. """
+
+    def begin(self):
+        self.separator = ""
+
+    def write(self, text):
+        self.file.write(self.separator + text)
+        self.separator = " "
+
+    def marker(self, label, position):
+        self.file.flush()
+        self.write(f"\n{label}")
+
+    def hunk(self, tag, i1, i2, j1, j2, words_1, words_2):
+        for word in words_1:
+            self.write(word if tag == "equal" else strikethrough(word))
+        for word in words_2:
+            self.write(underline(word))
+
+    def end(self):
+        self.file.write("\n")
+        self.file.flush()
+
+class JSON_Lines_Renderer(Diff_Renderer):
+    """ Writes one JSON object per line for every hunk and marker, e.g.
+            {"marker": "r1l2", "position": 17}
+            {"tag": "replace", "i1": 17, "i2": 19, "j1": 16, "j2": 17,
+             "deleted": ["per", "quos"], "inserted": ["Satanae"]}
+        Equal hunks have "words" instead of "deleted" and "inserted". """
+
+    def write(self, data):
+        self.file.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+    def marker(self, label, position):
+        self.write({'marker': label, 'position': position})
+
+    def hunk(self, tag, i1, i2, j1, j2, words_1, words_2):
+        data = {'tag': tag, 'i1': i1, 'i2': i2, 'j1': j1, 'j2': j2}
+        if tag == "equal":
+            data['words'] = words_1
+        else:
+            data['deleted'] = words_1
+            data['inserted'] = words_2
+        self.write(data)
+
+class HTML_Renderer(Diff_Renderer):
+    """ Writes an HTML page: deleted words in <del>, inserted words in <ins>,
+        every marker starts a new paragraph. """
+
+    HEADER = ('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+              '<style>del {color: #b00000;} ins {color: #007000;} '
+              '.marker {color: #808080; font-size: smaller;}</style>\n'
+              '</head>\n<body>\n<p>')
+    FOOTER = '</p>\n</body>\n</html>\n'
+
+    def begin(self):
+        self.file.write(self.HEADER)
+
+    def marker(self, label, position):
+        self.file.write(f'</p>\n<p><span class="marker">{html.escape(label)}</span> ')
+
+    def hunk(self, tag, i1, i2, j1, j2, words_1, words_2):
+        text = html.escape(" ".join(words_1))
+        if tag == "equal":
+            self.file.write(text + " ")
+            return
+        if words_1:
+            self.file.write(f"<del>{text}</del> ")
+        if words_2:
+            self.file.write(f"<ins>{html.escape(' '.join(words_2))}</ins> ")
+
+    def end(self):
+        self.file.write(self.FOOTER)
+        self.file.flush()
+
+# Helper functions:
+
+def strikethrough(text):
+    return ''.join([u'\u0336{}'.format(c) for c in text])
+
+def underline(text):
+    return ''.join([u'\u0332{}'.format(c) for c in text])
+
+def get_renderer(path=None):
+    """ Returns a renderer for a file name: "*.jsonl" -> JSON_Lines_Renderer,
+        "*.html" -> HTML_Renderer, otherwise Terminal_Renderer. Without a
+        path, the Terminal_Renderer writes to sys.stdout. The caller closes
+        the file (renderer.file). """
+    if path is None:
+        return Terminal_Renderer()
+    path = str(path)
+    renderer_class = Terminal_Renderer
+    if path.endswith(".jsonl"):
+        renderer_class = JSON_Lines_Renderer
+    elif path.endswith((".html", ".htm")):
+        renderer_class = HTML_Renderer
+    return renderer_class(open(path, "w", encoding="utf-8"))
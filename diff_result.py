@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Diff_Result object which stores the differences between
+    two editions with the Cts addresses of the words, so that they can be
+    saved and queried without comparing the editions again. """
+
+import json
+import gzip
+from array import array
+from bisect import bisect_left, bisect_right
+from word_stream import Vocabulary, Word_Stream, pack_array, unpack_array
+
+TAGS = ("equal", "delete", "insert", "replace")
+TAG_CODES = {tag: code for code, tag in enumerate(TAGS)}
+
+class Hunk:
+    """ One opcode of a Diff_Result: list_1[i1:i2] was replaced by
+        list_2[j1:j2]. start_1/end_1 and start_2/end_2 are the Cts
+        addresses of the first and the last word in both editions
+        (None if the span is empty). """
+
+    __slots__ = ("tag", "i1", "i2", "j1", "j2",
+                 "start_1", "end_1", "start_2", "end_2", "words_1", "words_2")
+
+    def __init__(self, tag, i1, i2, j1, j2, start_1, end_1, start_2, end_2, words_1, words_2):
+        self.tag = tag
+        self.i1, self.i2, self.j1, self.j2 = i1, i2, j1, j2
+        self.start_1, self.end_1 = start_1, end_1
+        self.start_2, self.end_2 = start_2, end_2
+        self.words_1 = words_1
+        self.words_2 = words_2
+
+    def __repr__(self):
+        return (f"<Hunk {self.tag} {self.start_1}–{self.end_1} -> {self.start_2}–{self.end_2}: "
+                f"{' '.join(self.words_1)!r} -> {' '.join(self.words_2)!r}>")
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+class Diff_Result:
+    """ The opcodes of the comparison of two Word_Streams (sharing a
+        Vocabulary) in arrays: one byte for the tag and four integers for
+        the spans per opcode. Hunk objects with the words and their Cts
+        addresses are created only when they are requested.
+
+            result = Diff_Result(stream_1, stream_2)
+            for opcode in result.collect(aligner.iter_opcodes(stream_1, stream_2)):
+                ...
+            result.save("differences.diff.gz")
+
+            result = Diff_Result.load("differences.diff.gz")
+            for hunk in result.hunks(tag="delete", pages_1=(10, 40)):
+                print(hunk.start_1, hunk.words_1) """
+
+    def __init__(self, stream_1, stream_2):
+        self.stream_1 = stream_1
+        self.stream_2 = stream_2
+        self.tags = array('B')
+        self.i1 = array('I')
+        self.i2 = array('I')
+        self.j1 = array('I')
+        self.j2 = array('I')
+
+    def append(self, opcode):
+        tag, i1, i2, j1, j2 = opcode
+        self.tags.append(TAG_CODES[tag])
+        self.i1.append(i1)
+        self.i2.append(i2)
+        self.j1.append(j1)
+        self.j2.append(j2)
+
+    def collect(self, opcodes):
+        """ Appends the opcodes (e.g. a generator) and yields them. """
+        for opcode in opcodes:
+            self.append(opcode)
+            yield opcode
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, index):
+        """ Returns the Hunk of an opcode. """
+        i1, i2, j1, j2 = self.i1[index], self.i2[index], self.j1[index], self.j2[index]
+        stream_1, stream_2 = self.stream_1, self.stream_2
+        return Hunk(TAGS[self.tags[index]], i1, i2, j1, j2,
+                    stream_1.address(i1) if i1 < i2 else None,
+                    stream_1.address(i2 - 1) if i1 < i2 else None,
+                    stream_2.address(j1) if j1 < j2 else None,
+                    stream_2.address(j2 - 1) if j1 < j2 else None,
+                    stream_1[i1:i2], stream_2[j1:j2])
+
+    def __iter__(self):
+        for index in range(len(self.tags)):
+            yield self[index]
+
+    def opcodes(self):
+        """ Yields the opcodes as (tag, i1, i2, j1, j2) tuples (without
+            creating Hunks). """
+        for code, i1, i2, j1, j2 in zip(self.tags, self.i1, self.i2, self.j1, self.j2):
+            yield TAGS[code], i1, i2, j1, j2
+
+    def hunks(self, tag=None, pages_1=None, pages_2=None):
+        """ Yields the Hunks with a certain tag (None = all; a string or a
+            tuple of strings) overlapping the page ranges pages_1 in the
+            first edition and pages_2 in the second edition ((first, last)
+            pageNr as int, None = all pages). E.g. all deletions on the pages
+            10–40: result.hunks("delete", pages_1=(10, 40)). """
+        tags = None if tag is None else {TAG_CODES[t] for t in ((tag,) if isinstance(tag, str) else tag)}
+        first, last = 0, len(self.tags)
+        # The spans are sorted, so the opcodes of a page range are found by bisection:
+        if pages_1:
+            start, end = self.stream_1.page_span(*pages_1)
+            first = max(first, bisect_right(self.i2, start))
+            last = min(last, bisect_left(self.i1, end))
+        span_2 = self.stream_2.page_span(*pages_2) if pages_2 else None
+        for index in range(first, last):
+            if tags is not None and self.tags[index] not in tags:
+                continue
+            if span_2 and not (self.j1[index] < span_2[1] and self.j2[index] > span_2[0]):
+                continue
+            yield self[index]
+
+    def save(self, path):
+        """ Writes the result, both Word_Streams and their Vocabulary to a
+            gzipped JSON file. The arrays are stored as base64 strings. """
+        data = {'vocabulary': self.stream_1.vocabulary.words,
+                'stream_1': self.stream_1.to_dict(),
+                'stream_2': self.stream_2.to_dict(),
+                'tags': pack_array(self.tags),
+                'i1': pack_array(self.i1),
+                'i2': pack_array(self.i2),
+                'j1': pack_array(self.j1),
+                'j2': pack_array(self.j2)}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """ Returns the Diff_Result saved in a file by save(). """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        vocabulary = Vocabulary()
+        for word in data['vocabulary']:
+            vocabulary.intern(word)
+        result = cls(Word_Stream.from_dict(data['stream_1'], vocabulary),
+                     Word_Stream.from_dict(data['stream_2'], vocabulary))
+        result.tags = unpack_array(data['tags'], 'B')
+        for name in ("i1", "i2", "j1", "j2"):
+            setattr(result, name, unpack_array(data[name]))
+        return result
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Document_Normalizer object which resolves the line breaks
+    between the pages of a document while the pages are being processed. """
+
+class Document_Normalizer:
+    """ Cleaner.resolve_linebreaks() handles the line breaks within a page
+        only: the first and the last word of every page remain untouched.
+        The Document_Normalizer eats the page objects of a document one by
+        one (in the order of the pages, e.g. from a generator) and treats
+        the break between the last line of a page and the first line of the
+        next page like any other line break. A hyphenated word is joined on
+        the page where it begins, so every line keeps its identifier.
+
+        A page is yielded as soon as the first line of the next page is
+        known, i.e. no more than two pages are kept in memory. The first
+        word of the document and the last word are cleaned like the words
+        at an unjoined line break (cf. Cleaner.join_words()). Pages which
+        do not follow each other (cf. page['cts'].pageNr) are not joined.
+
+            normalizer = Document_Normalizer(cleaner)
+            for page in normalizer.normalize(pages):
+                ...
+
+        cleaner -- a Cleaner object """
+
+    def __init__(self, cleaner):
+        self.cleaner = cleaner
+
+    def normalize(self, pages):
+        """ Eats an iterable of page objects and yields them after the
+            resolution of the line breaks between them. """
+        waiting = []        # the last page with lines and the pages without lines after it
+        last_line = None    # the last line of the last page with lines
+        last_pageNr = None
+        for page in pages:
+            pageNr = page_number(page)
+            if last_pageNr is not None and pageNr is not None and pageNr != last_pageNr + 1:
+                # A gap in the document: the pages are not joined.
+                if last_line is not None:
+                    self.clean_last_word(last_line)
+                yield from waiting
+                waiting = []
+                last_line = None
+            last_pageNr = pageNr
+
+            if page['lines']:
+                first_line = page['lines'][0]
+                if last_line is None:
+                    self.clean_first_word(first_line)
+                else:
+                    self.cleaner.resolve_linebreaks({'lines': [last_line, first_line]})
+                yield from waiting
+                waiting = []
+                last_line = page['lines'][-1]
+            waiting.append(page)
+
+        if last_line is not None:
+            self.clean_last_word(last_line)
+        yield from waiting
+
+    def clean_first_word(self, line):
+        """ Cleans the first word of a line (the first line of a document). """
+        if line['words'] and line['words'][0]['data_type'] == "word":
+            line['words'][0]['data'] = self.cleaner.clean_word(line['words'][0]['data'])
+
+    def clean_last_word(self, line):
+        """ Cleans the last word of a line (the last line of a document),
+            skipping one punctuation mark at the end of the line. """
+        words = line['words']
+        for index in (-1, -2):
+            if len(words) < -index:
+                return
+            if words[index]['data_type'] == "word":
+                words[index]['data'] = self.cleaner.clean_word(words[index]['data'])
+                return
+            if words[index]['data_type'] != "punctuation":
+                return
+
+# Helper functions:
+
+def page_number(page):
+    """ Returns the pageNr of a page object as int or None if it has no Cts. """
+    cts = page.get("cts")
+    return int(cts.pageNr) if cts is not None and cts.pageNr else None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Page_Fetcher object which downloads the page XML of a
+    sequence of pages in the background while the pages are processed. """
+
+import time
+from collections import deque
+from requests.exceptions import RequestException
+
+class Page_Fetcher:
+    """ Downloads the page XML of a sequence of pages with a pool of threads
+        and returns them in the order of the sequence. The download of the
+        next pages goes on while the caller processes the current page.
+
+        client   -- a Transkribus_Web object (or anything with a get_page_raw method)
+        pages    -- a list of (colId, docId, pageNr) tuples
+        executor -- a concurrent.futures.ThreadPoolExecutor. Several fetchers
+                    can share one executor; its max_workers is the maximum
+                    number of requests in flight.
+        window   -- maximum number of pages downloaded in advance
+        retries  -- how often a download failed with a transient error is repeated
+        backoff  -- seconds to wait before the first retry (doubled for
+                    every further retry)
+
+        The first pages are requested as soon as the fetcher is created.
+        Iterate over the fetcher to get (pageNr, page_xml) tuples; page_xml
+        (bytes) is False if the page could not be downloaded. """
+
+    def __init__(self, client, pages, executor, window=8, retries=3, backoff=1.0):
+        self.client = client
+        self.pages = deque(pages)
+        self.executor = executor
+        self.window = max(1, window)
+        self.retries = retries
+        self.backoff = backoff
+        self.pending = deque()  # futures in the order of the pages
+        self.fill()
+
+    def fill(self):
+        """ Submits downloads until self.window pages are pending. """
+        while self.pages and len(self.pending) < self.window:
+            colId, docId, pageNr = self.pages.popleft()
+            future = self.executor.submit(self.fetch, colId, docId, pageNr)
+            self.pending.append((pageNr, future))
+
+    def fetch(self, colId, docId, pageNr):
+        """ Downloads a page and retries with exponential backoff if the
+            request failed with a transient error (a RequestException, e.g.
+            a timeout or a 5xx status, cf. Transkribus_Web.request_raw()).
+            Other failures (e.g. a page which does not exist) return False
+            at once. """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return self.client.get_page_raw(colId, docId, pageNr)
+            except RequestException as e:
+                print(f"FETCHER: ERROR requesting {colId}/{docId}/{pageNr}: {e}")
+            if attempt < self.retries:
+                print(f"FETCHER: Retrying {colId}/{docId}/{pageNr} in {delay:.1f} s...")
+                time.sleep(delay)
+                delay *= 2
+        return False
+
+    def __iter__(self):
+        while self.pending:
+            pageNr, future = self.pending.popleft()
+            self.fill()
+            yield pageNr, future.result()
+
+    def cancel(self):
+        """ Cancels all downloads that have not started yet. """
+        self.pages.clear()
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Local_Source object which reads Transkribus documents
+    exported to the disk (mets.xml + page/*.xml) instead of downloading
+    them from the Transkribus server. """
+
+import re
+from pathlib import Path
+from lxml import etree, objectify
+from cts import Cts
+
+METS = "{http://www.loc.gov/METS/}"
+XLINK = "{http://www.w3.org/1999/xlink}"
+# Finds the status of the transcript in the metadata of a page XML file:
+STATUS_PATTERN = re.compile(rb'<TranskribusMetadata[^>]*\sstatus="(\w+)"')
+
+class Local_Source:
+    """ Reads the pages of Transkribus exports from the disk. A Transkribus
+        export is a folder containing a mets.xml file and the page XML files
+        (cf. Transkribus_Test_Data).
+
+        Local_Source provides the functions of Transkribus_Web which
+        Transkribus_CLI uses (get_collections(), get_documents_in_collection(),
+        get_pages_in_document(), get_page_xml() and get_page_raw()).
+        Therefore, it can replace the client of Transkribus_CLI, e.g.
+            Transkribus_CLI(client=Local_Source("Transkribus_Test_Data/Wild1559o-Mt,Mainz,BW"))
+        No login and no network is needed. The exports are the collections
+        and documents to choose from.
+
+        export_dirs -- paths to export folders (or to their mets.xml files) """
+
+    def __init__(self, *export_dirs):
+        self.documents = {}  # docId -> {'colId', 'colName', 'title', 'pages': {pageNr: path}}
+        self.session_id = False
+        self.cache = False
+        for export_dir in export_dirs:
+            self.add_export(export_dir)
+
+    def add_export(self, export_dir):
+        """ Reads the mets.xml file of an export and registers the document.
+            Returns the docId of the document. """
+        mets_path = Path(export_dir)
+        if mets_path.is_dir():
+            mets_path = mets_path / "mets.xml"
+        mets = etree.parse(str(mets_path)).getroot()
+
+        docId = mets.findtext(".//trpDocMetadata/docId") or mets.get("OBJID")
+        colId = mets.findtext(".//trpDocMetadata/collectionList/colList/colId") or "0"
+        colName = mets.findtext(".//trpDocMetadata/collectionList/colList/colName") or str(colId)
+        title = mets.findtext(".//trpDocMetadata/title") or mets.get("LABEL")
+
+        # The files of the PAGEXML group: FILEID -> path
+        files = {}
+        for f in mets.iterfind(f".//{METS}fileGrp[@ID='PAGEXML']/{METS}file"):
+            href = f.find(f"{METS}FLocat").get(f"{XLINK}href")
+            files[f.get("ID")] = mets_path.parent / href
+
+        # The page order is defined in the structMap:
+        pages = []
+        for div in mets.iterfind(f".//{METS}structMap//{METS}div[@ORDER]"):
+            for area in div.iterfind(f"{METS}fptr/{METS}area"):
+                if area.get("FILEID") in files:
+                    pages.append((int(div.get("ORDER")), files[area.get("FILEID")]))
+        pages.sort(key=lambda page: page[0])
+
+        self.documents[str(docId)] = {'colId': str(colId),
+                                      'colName': colName,
+                                      'title': title,
+                                      'pages': {str(pageNr): path for pageNr, path in pages}}
+        print(f"LOCAL: Found {len(pages)} pages of {title} ({colId}/{docId}) in {mets_path.parent}.")
+        return str(docId)
+
+    # The same interface as Transkribus_Web:
+
+    def login(self, username=None, password=None):
+        return True
+
+    def logout(self):
+        return True
+
+    def get_collections(self):
+        """ Returns the metadata of the collections of the exports like
+            Transkribus_Web.get_collections(). """
+        collections = {}
+        for doc in self.documents.values():
+            collection = collections.setdefault(doc['colId'], {'colId': doc['colId'],
+                                                               'colName': doc['colName'],
+                                                               'nrOfDocuments': 0})
+            collection['nrOfDocuments'] += 1
+        return list(collections.values()) or False
+
+    def get_documents_in_collection(self, colId):
+        """ Returns the metadata of the documents in a collection like
+            Transkribus_Web.get_documents_in_collection(). """
+        documents = [{'docId': docId, 'title': doc['title'], 'nrOfPages': len(doc['pages'])}
+                     for docId, doc in self.documents.items() if doc['colId'] == str(colId)]
+        return documents if documents else False
+
+    def get_pages_in_document(self, colId, docId):
+        """ Returns the metadata of the pages of a document like
+            Transkribus_Web.get_pages_in_document(): the pageNr and the
+            status of the transcript (read from the page XML file). """
+        document = self.documents.get(str(docId))
+        if document is None:
+            return False
+        pages = []
+        for pageNr, path in document['pages'].items():
+            try:
+                with open(path, "rb") as f:
+                    metadata = STATUS_PATTERN.search(f.read(4096))
+            except OSError:
+                continue
+            status = metadata.group(1).decode() if metadata else "NEW"
+            pages.append({'pageNr': int(pageNr),
+                          'tsList': {'transcripts': [{'status': status}]}})
+        return pages if pages else False
+
+    def get_page_xml(self, colId, docId, pageNr, revalidate=True):
+        """ Returns the page XML of a page as an "objectify" object (lxml)
+            or False if the page is not available (cf. Transkribus_Web.get_page_xml()). """
+        page_xml = self.get_page_raw(colId, docId, pageNr)
+        return objectify.fromstring(page_xml) if page_xml else False
+
+    def get_page_raw(self, colId, docId, pageNr, revalidate=True):
+        """ Returns the page XML of a page as bytes or False if the page
+            is not available (cf. Transkribus_Web.get_page_raw()). """
+        try:
+            path = self.documents[str(docId)]['pages'][str(pageNr)]
+            return path.read_bytes()
+        except (KeyError, OSError) as e:
+            print(f"LOCAL: ERROR reading {colId}/{docId}/{pageNr}: {e}")
+            return False
+
+    # Convenience functions:
+
+    def page_range(self, docId, first=None, last=None):
+        """ Returns a page range dict with two Cts objects (start, end) like
+            Transkribus_CLI.select_range_pipeline(). Without first and last,
+            the range covers the whole document. """
+        document = self.documents[str(docId)]
+        pageNrs = list(document['pages'])
+        first = pageNrs[0] if first is None else first
+        last = pageNrs[-1] if last is None else last
+        return {"start": Cts().from_string(f"tr:{document['colId']}.{docId}:{first}"),
+                "end": Cts().from_string(f"tr:{document['colId']}.{docId}:{last}")}
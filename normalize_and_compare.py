@@ -1,16 +1,57 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import sys
 from cli import Transkribus_CLI
 from cts import Cts
+from local_source import Local_Source
+from diff_renderer import get_renderer
+from censorship_detector import Censorship_Detector, print_blocks
+from corpus_index import print_documents
+
+def compare_exports(original_dir, censored_dir, output_path=None):
+    """ Compares two documents exported from Transkribus (folders containing
+        a mets.xml file) without connecting to the Transkribus server. The
+        differences are printed or written to output_path (*.html, *.jsonl
+        or a text file). If output_path ends with ".diff.gz", the Diff_Result
+        is saved instead (cf. Diff_Result.load()). Afterwards, the passages
+        most likely censored are printed (cf. censorship_detector.py). """
+    source = Local_Source()
+    original_docId = source.add_export(original_dir)
+    censored_docId = source.add_export(censored_dir)
+    cli = Transkribus_CLI(dictionary_cache_path="dictionary_cache.json", client=source,
+                          normalized_cache_path="normalized_cache", processes=None,
+                          corpus_index_path="corpus_index")
+    page_ranges = (source.page_range(original_docId), source.page_range(censored_docId))
+    if output_path and output_path.endswith(".diff.gz"):
+        result = cli.compare_pipeline(*page_ranges, renderer=False)
+        result.save(output_path)
+        print(f"Saved {len(result)} opcodes to {output_path}.")
+    else:
+        renderer = get_renderer(output_path)
+        try:
+            result = cli.compare_pipeline(*page_ranges, renderer)
+        finally:
+            if output_path:
+                renderer.file.close()
+    print_blocks(Censorship_Detector().find(result))
+    cli.logout()
 
 def main():
-    cli = Transkribus_CLI()
+    # Offline mode: python normalize_and_compare.py ORIGINAL_EXPORT CENSORED_EXPORT [OUTPUT]
+    if len(sys.argv) in (3, 4):
+        compare_exports(*sys.argv[1:])
+        return
+
+    cli = Transkribus_CLI(dictionary_cache_path="dictionary_cache.json",
+                          page_cache_path="page_cache",
+                          normalized_cache_path="normalized_cache",
+                          corpus_index_path="corpus_index")
     cli.login()
 
     # Choose operating mode according to the user's input:
     def choose_mode():
-        mode = input("Would you like to\n  1 - select and print a page or\n  2 - compare pages to find censorship?\n  > ")
+        mode = input("Would you like to\n  1 - select and print a page,\n  2 - compare pages to find censorship or\n  3 - search a phrase in all pages compared so far?\n  > ")
         if mode == "1":   # select and print a page
             print("Please, select the collection, the document and the page you want to print:")
             cts = cli.select_page_pipeline()
@@ -19,12 +60,22 @@ def main():
             print("\nPlease, select two page ranges to be compared.")
             print("Define the first page range (collection, document, first page, last page):")
             page_range_original = cli.select_range_pipeline()
-            print("Define the second page range (collection, document, first page, last page):")
-            page_range_censored = cli.select_range_pipeline()
+            find = input("Find the matching pages in the second document automatically (y/n)? ")
+            if find.strip().lower().startswith("y"):
+                print("Choose the second document (collection, document):")
+                page_range_censored = cli.select_matching_range_pipeline(page_range_original)
+            else:
+                print("Define the second page range (collection, document, first page, last page):")
+                page_range_censored = cli.select_range_pipeline()
 
             print(f"Differences found between\n{page_range_original['start'].to_string()}–{page_range_original['end'].pageNr} and\n{page_range_censored['start'].to_string()}–{page_range_censored['end'].pageNr}:\n")
 
-            cli.compare_pipeline(page_range_original, page_range_censored)
+            result = cli.compare_pipeline(page_range_original, page_range_censored)
+            print()
+            print_blocks(Censorship_Detector().find(result))
+        elif mode == "3": # search a phrase in the corpus index
+            phrase = input("Phrase (normalized words): ")
+            print_documents(cli.corpus_index, phrase)
         else:
             choose_mode()
     
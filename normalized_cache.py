@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Normalized_Cache object which keeps normalized page
+    objects on the disk, so that unchanged pages are not cleaned again. """
+
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from page_model import Line
+
+class Normalized_Cache:
+    """ A persistent cache of the page objects returned by
+        Transkribus_CLI.process_page() (the lines with raw_data, cleaned_data
+        and words after the resolution of the line breaks).
+
+        A page is stored under the SHA-1 hash of its page XML in the
+        subdirectory of the fingerprint of the Cleaner (cf.
+        Cleaner.fingerprint()), i.e. directory/<fingerprint>/<hash>.json.
+        If the replacement table, the hunspell dictionary or the cleaning
+        functions change, the fingerprint changes and the pages are cleaned
+        again. The subdirectories of other fingerprints are removed.
+
+        directory   -- the directory of the cache (created if necessary)
+        fingerprint -- the fingerprint of the Cleaner """
+
+    def __init__(self, directory, fingerprint):
+        self.directory = Path(directory)
+        self.pages = self.directory / fingerprint
+        self.pages.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+        # Remove the pages cleaned with other replacement tables or dictionaries:
+        for path in self.directory.iterdir():
+            if path.is_dir() and path != self.pages and is_fingerprint(path.name):
+                shutil.rmtree(path, ignore_errors=True)
+                print(f"NORMALIZED: INFO: Removed outdated pages ({path.name}).")
+
+    @staticmethod
+    def key(page_xml):
+        """ Returns the key of a page XML (bytes). """
+        return hashlib.sha1(page_xml).hexdigest()
+
+    def get(self, page_xml):
+        """ Returns the page object of a page XML (bytes) or None if it is
+            not in the cache. """
+        try:
+            with open(self.pages / f"{self.key(page_xml)}.json", "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {'lines': [Line.from_dict(line) for line in stored['lines']]}
+
+    def store(self, page_xml, page):
+        """ Stores the page object of a page XML (bytes). Only the lines are
+            stored (not the Cts object). """
+        path = self.pages / f"{self.key(page_xml)}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'lines': [line.to_dict() for line in page['lines']]}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        tmp_path.replace(path)
+
+# Helper functions:
+
+def is_fingerprint(name):
+    """ Returns True if name looks like a SHA-1 hash. """
+    return len(name) == 40 and all(c in "0123456789abcdef" for c in name)
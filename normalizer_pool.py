@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Normalizer_Pool object which cleans the pages of a
+    document in a pool of processes. """
+
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cleaner import Cleaner
+from page_parser import Page_Parser
+from page_model import Line
+
+class Normalizer_Pool:
+    """ Cleans pages (cf. normalize_page()) in several processes. The
+        cleaning is pure CPU work (regular expressions and hunspell), so a
+        document with many pages is cleaned about n times faster with n
+        processes (and n CPU cores).
+
+        Every process creates its own Cleaner (and hunspell object) once,
+        when the pool is started, i.e. when the first pages are cleaned. The
+        processes get the Prefix_Index (cf. dictionary.py) and a copy of the
+        dictionary cache of the given Cleaner, so the index is built only
+        once. The words looked up by a process are returned with its pages
+        and added to the dictionary cache of the given Cleaner, so they are
+        saved with it (cf. Dictionary.save_cache()).
+
+        The processes are started with "forkserver" (or "spawn" where it is
+        not available) instead of "fork": the pages are downloaded by
+        threads at the same time, and a process forked from a process with
+        running threads may inherit locks held by them.
+
+        cleaner   -- the Cleaner of the main process
+        processes -- the number of processes (None = number of CPUs). With
+                     1 process, the pages are cleaned by the given Cleaner
+                     in the main process.
+        window    -- maximum number of pages submitted in advance
+                     (default: 2 * processes) """
+
+    def __init__(self, cleaner, processes=1, window=None):
+        self.cleaner = cleaner
+        self.processes = processes if processes is not None else os.cpu_count() or 1
+        self.window = max(1, window or 2 * self.processes)
+        self.executor = None
+
+    def start(self):
+        """ Starts the processes (if they are not running yet). """
+        if self.executor is None:
+            dictionary = self.cleaner.dictionary
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self.executor = ProcessPoolExecutor(self.processes, mp_context=context,
+                                                initializer=init_worker,
+                                                initargs=(str(self.cleaner.replacement_table_path),
+                                                          dictionary.get_prefix_index(),
+                                                          dict(dictionary.cache)))
+        return self.executor
+
+    def normalize(self, items):
+        """ Eats an iterable of (key, page_xml) tuples and yields
+            (key, (page, error)) tuples in the same order (cf.
+            normalize_page()). key can be anything, e.g. the pageNr. If
+            page_xml is None, the item is passed on as (key, None), e.g.
+            for a page found in a cache. """
+        if self.processes == 1:
+            for key, page_xml in items:
+                yield key, None if page_xml is None else normalize_page(self.cleaner, page_xml)
+            return
+
+        executor = self.start()
+        pending = deque()
+        for key, page_xml in items:
+            pending.append((key, None if page_xml is None else executor.submit(normalize_in_worker, page_xml)))
+            if len(pending) >= self.window:
+                key, future = pending.popleft()
+                yield key, self.result(future)
+        while pending:
+            key, future = pending.popleft()
+            yield key, self.result(future)
+
+    def result(self, future):
+        """ Returns the (page, error) tuple of a worker (or None) and adds
+            the words it has looked up to the dictionary cache. """
+        if future is None:
+            return None
+        page, error, new_words = future.result()
+        self.cleaner.dictionary.merge_cache(new_words)
+        return page, error
+
+    def shutdown(self):
+        """ Stops the processes. """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+# Helper functions:
+
+def normalize_page(cleaner, page_xml):
+    """ Extracts the lines of a page XML (bytes) and cleans them with a
+        Cleaner (cf. Cleaner.clean_lines() and Cleaner.resolve_linebreaks()).
+        Returns a (page, error) tuple: the page object (a dict with a list
+        of Line objects) and None, or None and an error message if the page
+        contains no TextRegions, BaseLines or text. """
+    # The parser only returns the lines of TextRegions tagged as "paragraph"
+    # (cf. page_parser.py):
+    parser = Page_Parser(page_xml, region_type="paragraph")
+    parsed_lines = list(parser)
+    # Make sure that the page contained TextRegions, BaseLines and text:
+    error = parser.check_for_errors()
+    if error:
+        return None, error
+
+    # Clean all lines of the page at once and build the line objects:
+    cleaned_lines = cleaner.clean_lines([raw_data for regionNr, lineNr, raw_data in parsed_lines])
+    page = {"lines": [Line(f"r{regionNr}l{lineNr}", raw_data, cleaned, words)
+                      for (regionNr, lineNr, raw_data), (cleaned, words) in zip(parsed_lines, cleaned_lines)]}
+
+    # Resolve linebreaks on this page:
+    return cleaner.resolve_linebreaks(page), None
+
+# The Cleaner of a worker process:
+_cleaner = None
+
+def init_worker(replacement_table_path, prefix_index, dictionary_cache):
+    """ Creates the Cleaner of a worker process with the Prefix_Index and
+        the dictionary cache (a dict) of the main process. """
+    global _cleaner
+    _cleaner = Cleaner(replacement_table_path)
+    _cleaner.dictionary.prefix_index = prefix_index
+    _cleaner.dictionary.cache.update(dictionary_cache)
+    _cleaner.dictionary.new_words = {}
+
+def normalize_in_worker(page_xml):
+    """ normalize_page() with the Cleaner of the worker process. Returns
+        (page, error, new_words): new_words are the words looked up in the
+        dictionary since the last page (word -> True/False). """
+    page, error = normalize_page(_cleaner, page_xml)
+    new_words = _cleaner.dictionary.new_words
+    _cleaner.dictionary.new_words = {}
+    return page, error, new_words
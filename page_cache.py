@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Page_Cache object which keeps downloaded page XML files
+    on the disk. """
+
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+class Page_Cache:
+    """ A content-addressed on-disk cache for the page XML of Transkribus pages.
+
+        Every page XML file is stored once under the SHA-1 hash of its content
+        (directory/objects/<hash>.xml). The index (directory/index.json) maps
+        a transcript, i.e. "colId/docId/pageNr/tsId", to the hash and the time
+        of the last access. A new transcript of a page (e.g. after an upload)
+        gets a new tsId and is therefore downloaded again.
+
+        directory -- the directory of the cache (created if necessary)
+        max_bytes -- maximum size of the stored files. If the cache grows larger,
+                     the transcripts which were not used for the longest time
+                     are removed.
+        save_every -- the index is written to the disk by save() and after
+                     every save_every new transcripts (so that a crash loses
+                     no more than these). """
+
+    def __init__(self, directory="page_cache", max_bytes=500 * 1024**2, save_every=100):
+        self.directory = Path(directory)
+        self.objects = self.directory / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.json"
+        self.max_bytes = max_bytes
+        self.save_every = save_every
+        self.lock = threading.Lock()  # pages are downloaded by several threads
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            self.transcripts = stored['transcripts']  # key -> {'sha', 'size', 'used'}
+            self.latest = stored['latest']            # "colId/docId/pageNr" -> tsId
+        except (OSError, ValueError, KeyError):
+            self.transcripts = {}
+            self.latest = {}
+
+        # The transcripts are kept in the order of their last access (the
+        # least recently used first), so _evict() takes them from the front:
+        self.transcripts = dict(sorted(self.transcripts.items(), key=lambda item: item[1]['used']))
+        self.sizes = {}       # sha -> size of the file
+        self.references = {}  # sha -> number of transcripts with this file
+        for entry in self.transcripts.values():
+            self.sizes[entry['sha']] = entry['size']
+            self.references[entry['sha']] = self.references.get(entry['sha'], 0) + 1
+        self.total_bytes = sum(self.sizes.values())
+        self.unsaved = 0      # transcripts stored since the index was written
+        self.dirty = False    # the index has changed since it was written
+
+    # Internal helper functions:
+
+    @staticmethod
+    def _key(colId, docId, pageNr, tsId=None):
+        key = f"{colId}/{docId}/{pageNr}"
+        return key if tsId is None else f"{key}/{tsId}"
+
+    def _path(self, sha):
+        return self.objects / f"{sha}.xml"
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'transcripts': self.transcripts,
+                       'latest': self.latest}, f)
+        tmp_path.replace(self.index_path)
+        self.unsaved = 0
+        self.dirty = False
+
+    def _remove(self, key):
+        """ Removes a transcript. Its file is deleted when no transcript
+            refers to it any more. """
+        sha = self.transcripts.pop(key)['sha']
+        page, tsId = key.rsplit("/", 1)
+        if self.latest.get(page) == tsId:
+            del self.latest[page]
+        self.references[sha] -= 1
+        if not self.references[sha]:
+            del self.references[sha]
+            self.total_bytes -= self.sizes.pop(sha)
+            self._path(sha).unlink(missing_ok=True)
+        self.dirty = True
+
+    def _evict(self):
+        """ Removes the least recently used transcripts until the cache is not
+            larger than self.max_bytes. """
+        while self.total_bytes > self.max_bytes and self.transcripts:
+            self._remove(next(iter(self.transcripts)))
+
+    # Public functions:
+
+    def latest_tsId(self, colId, docId, pageNr):
+        """ Returns the tsId of the most recent transcript of a page in the
+            cache (without asking the server) or None. """
+        return self.latest.get(self._key(colId, docId, pageNr))
+
+    def get(self, colId, docId, pageNr, tsId):
+        """ Returns the page XML (bytes) of a transcript or None if it
+            is not in the cache. """
+        key = self._key(colId, docId, pageNr, tsId)
+        with self.lock:
+            entry = self.transcripts.get(key)
+            if entry is not None:
+                try:
+                    content = self._path(entry['sha']).read_bytes()
+                except OSError:
+                    self._remove(key)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry['used'] = time.time()
+            # (Move the transcript to the end of the order of access.)
+            self.transcripts[key] = self.transcripts.pop(key)
+            self.dirty = True
+            self.hits += 1
+            return content
+
+    def store(self, colId, docId, pageNr, tsId, content):
+        """ Stores the page XML (bytes) of a transcript. """
+        sha = hashlib.sha1(content).hexdigest()
+        key = self._key(colId, docId, pageNr, tsId)
+        with self.lock:
+            if key in self.transcripts:
+                self._remove(key)
+            path = self._path(sha)
+            if not path.exists():
+                tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(content)
+                tmp_path.replace(path)
+            if sha not in self.references:
+                self.references[sha] = 0
+                self.sizes[sha] = len(content)
+                self.total_bytes += len(content)
+            self.references[sha] += 1
+            self.transcripts[key] = {'sha': sha,
+                                     'size': len(content),
+                                     'used': time.time()}
+            self.latest[self._key(colId, docId, pageNr)] = str(tsId)
+            self.dirty = True
+            self._evict()
+            self.unsaved += 1
+            if self.unsaved >= self.save_every:
+                self._save_index()
+
+    def save(self):
+        """ Writes the index (including the access times) to the disk if it
+            has changed. """
+        with self.lock:
+            if self.dirty:
+                self._save_index()
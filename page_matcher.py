@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Page_Index object which finds the pages of an edition
+    matching a page range of another edition (e.g. of a repaginated
+    expurgated edition). """
+
+import heapq
+import hashlib
+from array import array
+
+class Page_Index:
+    """ An index of the pages of a document which finds the pages containing
+        the text of a page range of another document:
+
+            index = Page_Index()
+            index.add_pages(cli.iter_pages(censored_document))
+            index.match_pages(original_pages)   -> (first, last) pageNr
+
+        The text of every page is split into shingles (sequences of
+        shingle_size words) which are hashed to 64-bit integers. Only the
+        sketch_size smallest hashes of a page are kept (a bottom-k MinHash
+        sketch): they are a random sample of the shingles of the page, so
+        the share of them found in the shingles of the page range estimates
+        which share of the page belongs to the range (its containment).
+        Unlike the similarity of two pages, the containment is not lowered
+        by repagination, when a page holds the end of one page and the
+        beginning of the next page of the other edition.
+
+        The matching range is the sequence of pages which maximizes the sum
+        of containment - threshold (the maximum subarray). The threshold is
+        low, so that the pages at the edges of the range, which contain only
+        a part of the text, are included: otherwise their text would be
+        reported as deleted by the comparison. Pages with too few words for
+        a shingle neither extend nor end a range. A query costs
+        sketch_size set lookups per page of the index (about 10 ms for 1000
+        pages).
+
+        shingle_size -- the number of words per shingle
+        sketch_size  -- the number of hashes kept per page
+        threshold    -- the minimum containment of a page of the range """
+
+    def __init__(self, shingle_size=3, sketch_size=64, threshold=0.25):
+        self.shingle_size = shingle_size
+        self.sketch_size = sketch_size
+        self.threshold = threshold
+        self.pageNrs = []    # the pageNr of every page (int)
+        self.sketches = []   # the sketch of every page (array of hashes)
+
+    def __len__(self):
+        return len(self.pageNrs)
+
+    def add_page(self, pageNr, words):
+        """ Adds a page (after the pages already added) with its words (a
+            list of strings). """
+        hashes = shingles(words, self.shingle_size)
+        self.pageNrs.append(int(pageNr))
+        self.sketches.append(array('Q', heapq.nsmallest(self.sketch_size, hashes)))
+
+    def add_pages(self, pages):
+        """ Adds page objects with Cts (cf. Transkribus_CLI.iter_pages()). """
+        for page in pages:
+            self.add_page(page['cts'].pageNr, page_words(page))
+
+    def containments(self, words):
+        """ Returns the estimated containment of every page in a text (a list
+            of words) or None for pages without shingles. """
+        query = shingles(words, self.shingle_size)
+        return [sum(1 for h in sketch if h in query) / len(sketch) if sketch else None
+                for sketch in self.sketches]
+
+    def match(self, words):
+        """ Returns the (first, last) pageNr of the pages matching a text (a
+            list of words) or None if no page contains enough of it. """
+        return best_range(self.pageNrs, self.containments(words), self.threshold)
+
+    def match_pages(self, pages):
+        """ Like match(), but eats page objects (e.g. the page range of the
+            other edition). """
+        return self.match([word for page in pages for word in page_words(page)])
+
+# Helper functions:
+
+def page_words(page):
+    """ Returns the words of a page object without punctuation (cf.
+        Transkribus_CLI.extract_words_from_pages()). """
+    return [word.data for line in page['lines'] for word in line.words
+            if word.data_type != "punctuation"]
+
+def best_range(pageNrs, containments, threshold):
+    """ Returns the (first, last) pageNr of the pages with the maximum sum
+        of containment - threshold (cf. Page_Index) or None if no page has a
+        containment above threshold. Pages with a containment of None are
+        skipped. """
+    best, best_pages = 0.0, None
+    total, start = 0.0, None
+    for index, containment in enumerate(containments):
+        if containment is None:
+            continue
+        if start is None or total <= 0:
+            total, start = 0.0, index
+        total += containment - threshold
+        if total > best:
+            best, best_pages = total, (pageNrs[start], pageNrs[index])
+    return best_pages
+
+def shingles(words, size):
+    """ Returns the set of the hashes (64-bit integers) of all sequences of
+        size words. The hashes do not depend on the process (unlike hash()),
+        so sketches can be compared across processes. """
+    return {int.from_bytes(hashlib.blake2b(" ".join(words[i:i+size]).encode("utf-8"),
+                                           digest_size=8).digest(), "little")
+            for i in range(len(words) - size + 1)}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Word and Line objects which hold the tokens and lines of
+    a page (cf. Cleaner.tokenize() and Transkribus_CLI.process_page()). """
+
+class Word:
+    """ A token of a line: data_type is "word", "punctuation", "unreadable",
+        "partially_unreadable" or "empty", data is the text.
+
+        Words used to be dicts ({'data_type': ..., 'data': ...}). A Word
+        takes a fraction of the memory of a dict, but it can still be used
+        like one, e.g. word['data'] or word['data'] = "..." (cf.
+        Cleaner.resolve_linebreaks()). """
+
+    __slots__ = ("data_type", "data")
+
+    def __init__(self, data_type, data):
+        self.data_type = data_type
+        self.data = data
+
+    def __repr__(self):
+        return f"Word({self.data_type!r}, {self.data!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, Word):
+            return self.data_type == other.data_type and self.data == other.data
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    # The dict interface:
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {'data_type': self.data_type, 'data': self.data}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['data_type'], data['data'])
+
+class Line:
+    """ A line of a page: the identifier ("r{regionNr}l{lineNr}"), the text
+        of the page XML (raw_data), the text after the replacement of the
+        abbreviations (cleaned_data) and a list of Words (words).
+        Like Word, a Line can be used like the former dict. """
+
+    __slots__ = ("identifier", "raw_data", "cleaned_data", "words")
+
+    def __init__(self, identifier, raw_data, cleaned_data, words):
+        self.identifier = identifier
+        self.raw_data = raw_data
+        self.cleaned_data = cleaned_data
+        self.words = words
+
+    def __repr__(self):
+        return f"Line({self.identifier!r}, {len(self.words)} words)"
+
+    # The dict interface:
+
+    __getitem__ = Word.__getitem__
+    __setitem__ = Word.__setitem__
+    get = Word.get
+    keys = Word.keys
+
+    def to_dict(self):
+        return {'identifier': self.identifier,
+                'raw_data': self.raw_data,
+                'cleaned_data': self.cleaned_data,
+                'words': [word.to_dict() for word in self.words]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['identifier'], data['raw_data'], data['cleaned_data'],
+                   [Word.from_dict(word) for word in data['words']])
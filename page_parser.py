@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Page_Parser object which reads the text lines of a
+    page XML file (or of a whole-document export) in one pass. """
+
+import re
+from io import BytesIO
+from lxml import etree
+
+# The namespace string used by the Transkribus page_xml format:
+NS = "{http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15}"
+TEXT_REGION = f"{NS}TextRegion"
+TEXT_LINE = f"{NS}TextLine"
+BASELINE = f"{NS}Baseline"
+TEXT_EQUIV = f"{NS}TextEquiv"
+UNICODE = f"{NS}TextEquiv/{NS}Unicode"
+CUSTOM_ATTRIBUTES = re.compile(r'\{(\w*?):(\w*?);\}')
+
+def get_custom_attributes(string):
+    """ Returns the custom attributes of a TextRegion or TextLine as a dict,
+        e.g. "readingOrder {index:0;} structure {type:paragraph;}" ->
+        {'index': '0', 'type': 'paragraph'}. """
+    return dict(CUSTOM_ATTRIBUTES.findall(string or ""))
+
+class Page_Parser:
+    """ Reads the page XML of a Transkribus page (bytes or a path) and yields
+        the TextLines of the TextRegions of a certain type (e.g. "paragraph")
+        as (regionNr, lineNr, text) tuples. The custom attributes of a
+        TextRegion are read only once for all its lines. Usage:
+
+            parser = Page_Parser(page_xml)
+            for regionNr, lineNr, text in parser:
+                ...
+            error = parser.check_for_errors()
+
+        Files and large inputs (e.g. whole-document exports) are read with
+        etree.iterparse(), and every element is thrown away as soon as it has
+        been read, so that the memory needed does not grow with the size of
+        the input. A single page in memory is parsed at once, which is faster
+        for small inputs.
+
+        region_type         -- the type of the TextRegions to read (None = all)
+        streaming_threshold -- inputs (bytes) of this size or larger are streamed """
+
+    def __init__(self, source, region_type="paragraph", streaming_threshold=1024**2):
+        self.source = source
+        self.region_type = region_type
+        self.streaming_threshold = streaming_threshold
+        # Counters used by check_for_errors() (when the whole input is parsed at
+        # once, they only tell whether there is at least one element):
+        self.regions = 0
+        self.baselines = 0
+        self.text_equivs = 0
+        # The current TextRegion and its custom attributes:
+        self.region = None
+        self.attributes = {}
+
+    def __iter__(self):
+        if isinstance(self.source, bytes) and len(self.source) < self.streaming_threshold:
+            return self.iter_tree()
+        else:
+            return self.iter_stream()
+
+    def iter_tree(self):
+        """ Parses the whole input at once and yields the lines. """
+        root = etree.fromstring(self.source, etree.XMLParser(remove_blank_text=True))
+        for element in root.iter(TEXT_LINE):
+            line = self.read_line(element)
+            if line:
+                yield line
+        self.regions = int(root.find(f".//{TEXT_REGION}") is not None)
+        self.baselines = int(root.find(f".//{BASELINE}") is not None)
+        self.text_equivs = int(root.find(f".//{TEXT_EQUIV}") is not None)
+
+    def iter_stream(self):
+        """ Parses the input element by element and yields the lines. """
+        source = BytesIO(self.source) if isinstance(self.source, bytes) else str(self.source)
+        for _, element in etree.iterparse(source, tag=(TEXT_LINE, TEXT_REGION),
+                                          remove_blank_text=True):
+            if element.tag == TEXT_LINE:
+                if element.find(BASELINE) is not None:
+                    self.baselines += 1
+                if element.find(f".//{TEXT_EQUIV}") is not None:
+                    self.text_equivs += 1
+                line = self.read_line(element)
+                if line:
+                    yield line
+                element.clear()
+            else:
+                self.regions += 1
+                if element.find(TEXT_EQUIV) is not None:
+                    self.text_equivs += 1
+                self.region = None
+                element.clear()
+                # Remove the finished regions from the page:
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    def read_line(self, element):
+        """ Returns the (regionNr, lineNr, text) tuple of a TextLine element
+            or None if its TextRegion does not have the right type. """
+        parent = element.getparent()
+        if parent is not self.region:
+            self.region = parent
+            self.attributes = get_custom_attributes(parent.get("custom"))
+        if self.region_type is None or self.attributes.get("type") == self.region_type:
+            lineNr = get_custom_attributes(element.get("custom"))['index']
+            # The text of the line itself (not of its Words):
+            return self.attributes['index'], lineNr, element.findtext(UNICODE) or ""
+        return None
+
+    def check_for_errors(self):
+        """ Make sure that the page_xml contained
+            – TextRegions
+            – Baselines
+            – TextEquiv, i.e. actual text in the lines.
+            Call this function after iterating over the parser.
+
+            Returns False if everything is OK, otherwise an error message. """
+        if self.regions == 0:
+            return "PAGE-XML: ERROR: No TextRegions found."
+        if self.baselines == 0:
+            return "PAGE-XML: ERROR: No BaseLines found."
+        if self.text_equivs == 0:
+            return "PAGE-XML: ERROR: Lines contain no text."
+        return False
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Replacement_Engine object which applies the rows of the
+    replacement table (cf. replacement_table.tsv) to a text. """
+
+import re
+from bisect import bisect_right, insort
+from collections import deque
+
+class Replacement_Rule:
+    """ One row of the replacement table, compiled once:
+        regex    -- the compiled pattern (case insensitive)
+        func     -- the helper function preserving the case of the original text
+        literal  -- a (casefolded) string that must occur in every text the
+                    pattern can match. It is used to skip patterns that cannot
+                    match without running the regex at all. "" if the pattern
+                    has no such literal.
+        is_literal -- True if the pattern matches nothing but the literal
+                    (e.g. "\\&cæt\\."). Such a row is applied with string
+                    functions instead of the regex (cf. apply()). """
+
+    __slots__ = ("pattern", "replacement", "regex", "convert", "literal", "is_literal",
+                 "folded_replacement", "overlapping")
+
+    def __init__(self, pattern, replacement):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.regex = re.compile(pattern, flags=re.IGNORECASE)
+        self.convert = self.case_preserving(replacement)
+        text = literal_text(pattern)
+        # (If casefolding changes the length of the literal, e.g. "ß" -> "ss",
+        # the positions in the folded text do not fit the original text.)
+        self.is_literal = text is not None and len(fold(text)) == len(text)
+        self.literal = fold(text) if self.is_literal else fold(required_literal(pattern))
+        # The replacement of the literal in a casefolded text:
+        self.folded_replacement = self.convert(self.literal)
+        # True if two occurrences of the literal can overlap (e.g. "aa"):
+        self.overlapping = any(self.literal[:i] == self.literal[-i:] for i in range(1, len(self.literal)))
+
+    @staticmethod
+    def case_preserving(repl):
+        """ Returns a helper function which eats the matched text and returns
+            the replacement in the case of the matched text. """
+        lower, title, upper = repl.lower(), repl.title(), repl.upper()
+
+        def convert(g):
+            if g.islower(): return lower
+            if g.istitle(): return title
+            if g.isupper(): return upper
+            return repl
+
+        return convert
+
+    def func(self, match):
+        """ The helper function for re.sub(). """
+        return self.convert(match.group())
+
+    def apply(self, text, folded):
+        """ Replaces all matches in a text (folded = fold(text)) like
+            regex.subn(). Returns the new text and the number of matches.
+            A literal row is searched in the folded text with str.find()
+            unless casefolding has changed the length of the text. For every
+            other character, fold() matches the same characters as
+            re.IGNORECASE, so the result is the same as with the regex. """
+        if not self.is_literal or len(folded) != len(text):
+            return self.regex.subn(self.func, text)
+        literal = self.literal
+        n = folded.count(literal)
+        if not n:
+            return text, 0
+        if text == folded or (not self.overlapping and text.count(literal) == n):
+            # Every match is the literal itself (not e.g. "Cæt" for "cæt"):
+            return text.replace(literal, self.folded_replacement), n
+        position = folded.find(literal)
+        if position < 0:
+            return text, 0
+        parts = []
+        end = n = 0
+        while position >= 0:
+            parts.append(text[end:position])
+            end = position + len(literal)
+            parts.append(self.convert(text[position:end]))
+            n += 1
+            position = folded.find(literal, end)
+        parts.append(text[end:])
+        return "".join(parts), n
+
+
+class Replacement_Engine:
+    """ Applies all rows of a replacement table to a text in the order of
+        the table. The patterns are compiled only once when the engine is
+        built. Before a pattern is run on a text, the engine checks whether
+        the text contains the literal part of the pattern (e.g. "cæt" for
+        "\\&cæt\\." or "cael" for "\\bcael"). Most of the ~300 rows never
+        match a given line, so most of them are skipped. The literals of all
+        rows are searched at once in one pass over the text by an
+        Aho_Corasick automaton instead of one substring test per row.
+
+        The rows found are applied in the order of the table. A replacement
+        can create the literal of a later row, but only if the literal
+        overlaps the inserted text. So the rows whose literal overlaps the
+        replacement of a row are computed in advance (cf. enabled_rules()),
+        and only these are checked again after the row has changed the
+        text (cf. enabled_by()). Most rows are literals (cf. Replacement_Rule.is_literal) and
+        are applied without the regex. The result is identical to calling
+        re.sub() for every row.
+
+        replacement_table -- an OrderedDict as returned by
+                             IO_Tools.replacement_table_from_file() """
+
+    def __init__(self, replacement_table):
+        self.rules = [Replacement_Rule(r"{}".format(pattern), row['replacement'])
+                      for pattern, row in replacement_table.items()]
+        self.automaton = Aho_Corasick([rule.literal for rule in self.rules])
+        # The rules without a literal are run on every text:
+        self.unfiltered = {index for index, rule in enumerate(self.rules) if not rule.literal}
+        self.enabled = self.enabled_rules()
+        self.rules_by_literal = {}
+        for index, rule in enumerate(self.rules):
+            self.rules_by_literal.setdefault(rule.literal, []).append(index)
+
+    def enabled_rules(self):
+        """ Returns for every rule the literals of the later rules whose
+            literal can occur in a text after the rule has changed it, but
+            not before: the literal must overlap the replacement (in any
+            case, cf. Replacement_Rule.case_preserving()), i.e. contain it,
+            lie within it, or begin or end within it. If the replacement is
+            empty, a literal can be joined from the text before and after
+            the removed match, so all later rules are returned. """
+        # The literals by their substrings, beginnings and endings:
+        containing, starting, ending = {}, {}, {}
+        for index, rule in enumerate(self.rules):
+            literal = rule.literal
+            for i in range(len(literal)):
+                starting.setdefault(literal[:i+1], set()).add(index)
+                ending.setdefault(literal[i:], set()).add(index)
+                for j in range(i + 1, len(literal) + 1):
+                    containing.setdefault(literal[i:j], set()).add(index)
+
+        enabled = []
+        for index, rule in enumerate(self.rules):
+            repl = rule.replacement
+            found = set()
+            for variant in {fold(v) for v in (repl, repl.lower(), repl.title(), repl.upper())}:
+                if not variant:
+                    found.update(range(len(self.rules)))
+                    break
+                found |= self.automaton.find(variant)
+                found |= containing.get(variant, set())
+                for i in range(1, len(variant)):
+                    found |= ending.get(variant[:i], set())
+                    found |= starting.get(variant[i:], set())
+            enabled.append(tuple({self.rules[later].literal: None for later in sorted(found)
+                                  if later > index and self.rules[later].literal}))
+        return enabled
+
+    def enabled_by(self, index, folded):
+        """ Returns the indices of the later rules which the rule index may
+            have enabled in a text it has changed (folded = fold(text)). If
+            the rule enables more literals than the text has characters
+            (e.g. a replacement with a common letter in a big table), the
+            text is searched again by the automaton instead of testing every
+            literal. """
+        enabled = self.enabled[index]
+        if len(enabled) > len(folded):
+            return [later for later in self.automaton.find(folded) if later > index]
+        return [later for literal in filter(folded.__contains__, enabled)
+                for later in self.rules_by_literal[literal] if later > index]
+
+    def replace(self, text):
+        """ Applies all rules to the text and returns the new text. """
+        text = str(text)
+        folded = fold(text)
+        rules = self.rules
+        found = self.automaton.find(folded)
+        found.update(self.unfiltered)
+        pending = sorted(found)
+        k = 0
+        while k < len(pending):
+            index = pending[k]
+            k += 1
+            new_text, n = rules[index].apply(text, folded)
+            # (Case insensitive rows often replace a text with itself, e.g. "s" for "s".)
+            if not n or new_text == text:
+                continue
+            text = new_text
+            new_folded = fold(text)
+            # (E.g. "ſ" -> "s" does not change the casefolded text.)
+            if new_folded == folded:
+                continue
+            folded = new_folded
+            for later in self.enabled_by(index, folded):
+                if later not in found:
+                    found.add(later)
+                    insort(pending, later, k)
+        return text
+
+    def replace_lines(self, lines):
+        """ Applies all rules to a list of lines (e.g. all lines of a page)
+            and returns the list of the new lines. The result is identical
+            to calling replace() for every line.
+
+            The casefolded lines are joined with LINE_SEPARATOR to a single
+            text, which is searched for the literals of all rules in one
+            pass. Every rule found only runs on the lines where its literal
+            was found (at most once per line). A line changed by a rule is
+            checked for the rules enabled by it. (Running every rule once on
+            the joined text is about 3.5 times slower: a rule whose literal
+            occurs on one line would run its regex on the whole page, and
+            every change would casefold the whole page and search it for the
+            rules enabled by the change.) """
+        lines = [str(line) for line in lines]
+        rules = self.rules
+        folded_lines = [fold(line) for line in lines]
+        folded, starts = join_lines(folded_lines)
+
+        found = {}  # index of the rule -> indices of the lines
+        for end, index in self.automaton.matches(folded):
+            found.setdefault(index, set()).add(bisect_right(starts, end - 1) - 1)
+        if lines:
+            for index in self.unfiltered:
+                found[index] = set(range(len(lines)))
+        pending = sorted(found)
+        k = 0
+        while k < len(pending):
+            index = pending[k]
+            k += 1
+            rule = rules[index]
+            for line_index in sorted(found.pop(index)):
+                text, n = rule.apply(lines[line_index], folded_lines[line_index])
+                if not n or text == lines[line_index]:
+                    continue
+                lines[line_index] = text
+                folded = fold(text)
+                if folded == folded_lines[line_index]:
+                    continue
+                folded_lines[line_index] = folded
+                for later in self.enabled_by(index, folded):
+                    if later not in found:
+                        found[later] = set()
+                        insort(pending, later, k)
+                    found[later].add(line_index)
+        return lines
+
+class Aho_Corasick:
+    """ Finds all occurrences of a list of strings in a text in one pass
+        (Aho and Corasick, 1975). The strings are stored in a trie; a state
+        of the automaton is a node of the trie, i.e. the longest end of the
+        text read so far which is the beginning of a string. The
+        transitions of every state are computed in advance (including the
+        ones of the failure links), so every character of the text costs a
+        single dict lookup, no matter how many strings are searched.
+
+            automaton = Aho_Corasick(["cæt", "q;", "æt"])
+            automaton.find("& cæt.")   -> {0, 2}
+
+        strings -- a list of strings (empty strings are never found) """
+
+    def __init__(self, strings):
+        goto = [{}]      # the edges of the trie
+        outputs = [[]]   # the indices of the strings ending in a state
+        for index, string in enumerate(strings):
+            if not string:
+                continue
+            state = 0
+            for c in string:
+                next_state = goto[state].get(c)
+                if next_state is None:
+                    next_state = goto[state][c] = len(goto)
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+
+        # The states in breadth-first order: the failure link of a state
+        # (the state of its longest proper end) has already been processed.
+        transitions = [None] * len(goto)
+        transitions[0] = dict(goto[0])
+        failure = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, child in goto[state].items():
+                failure[child] = transitions[failure[state]].get(c, 0) if state else 0
+                queue.append(child)
+            if state:
+                transitions[state] = dict(transitions[failure[state]])
+                transitions[state].update(goto[state])
+                outputs[state] = outputs[state] + outputs[failure[state]]
+        self.transitions = transitions
+        self.outputs = [tuple(output) or None for output in outputs]
+
+    def matches(self, text):
+        """ Yields (end, index) for every occurrence of a string in the text,
+            i.e. strings[index] == text[end - len(strings[index]):end]. """
+        transitions, outputs = self.transitions, self.outputs
+        state = 0
+        for position, c in enumerate(text, 1):
+            state = transitions[state].get(c, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    yield position, index
+
+    def find(self, text):
+        """ Returns the indices of the strings occurring in the text (a set). """
+        transitions, outputs = self.transitions, self.outputs
+        found = set()
+        state = 0
+        for c in text:
+            state = transitions[state].get(c, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+# Helper functions:
+
+# Joins the lines in Replacement_Engine.replace_lines() and
+# Cleaner.tokenize_lines(). It cannot occur in the text of a page XML:
+LINE_SEPARATOR = "\x00"
+
+def join_lines(lines):
+    """ Returns the lines joined with LINE_SEPARATOR and a list of the
+        positions where the lines start in the joined text. """
+    starts = []
+    position = 0
+    for line in lines:
+        starts.append(position)
+        position += len(line) + 1
+    return LINE_SEPARATOR.join(lines), starts
+
+# re.IGNORECASE treats "İ" and "ı" (dotted capital I, dotless small i) as
+# variants of "i". str.casefold() does not, so they are mapped to "i" first.
+# For every other character, casefold() agrees with re.IGNORECASE.
+# (Two str.replace() are much faster than str.translate() with a table.)
+
+def fold(text):
+    """ Returns a caseless version of the text which can be used to check
+        whether a case insensitive pattern might match. """
+    return text.replace('İ', 'i').replace('ı', 'i').casefold()
+
+def literal_text(pattern):
+    """ Returns the text matched by a regex pattern if the pattern consists
+        of literal characters and escaped metacharacters only (e.g. "&cæt."
+        for "\\&cæt\\."), otherwise None. """
+    text = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            nxt = pattern[i+1:i+2]
+            if nxt == "" or nxt.isalnum():
+                return None             # \b, \s, \1 etc.
+            text.append(nxt)
+            i += 2
+        elif c in ".^$*+?{}[]|()":
+            return None
+        else:
+            text.append(c)
+            i += 1
+    return "".join(text) or None
+
+def required_literal(pattern):
+    """ Returns the longest sequence of literal characters that must occur in
+        every match of a regex pattern, or "" if there is none. Character
+        classes, groups, escapes like \\s and optional characters end a
+        sequence. Patterns with alternations ("|") or inline flags return "". """
+
+    if "(?" in pattern:
+        return ""
+
+    runs = [""]
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            nxt = pattern[i+1:i+2]
+            i += 2
+            if nxt in ("b", "B"):       # zero-width: the sequence goes on
+                continue
+            if nxt == "" or nxt.isalnum():
+                runs.append("")         # \s, \d, \w, \1 etc.
+                continue
+            runs[-1] += nxt             # escaped metacharacter, e.g. "\."
+        elif c == "|":
+            return ""
+        elif c in "[(":
+            i = _skip_group(pattern, i)
+            runs.append("")
+            continue
+        elif c == "{":                  # a quantifier like {2,3}
+            i = pattern.find("}", i) + 1 or len(pattern)
+            runs.append("")
+            continue
+        elif c in ".^$?*+":
+            i += 1
+            runs.append("")
+            continue
+        else:
+            runs[-1] += c
+            i += 1
+
+        # A quantifier after the character just added:
+        quantifier = pattern[i:i+1]
+        if quantifier in ("?", "*", "{"):
+            runs[-1] = runs[-1][:-1]    # the character is optional
+            runs.append("")
+        elif quantifier == "+":
+            runs.append("")
+
+    return max(runs, key=len)
+
+def _skip_group(pattern, i):
+    """ Returns the index after the character class or group starting at i. """
+    if pattern[i] == "[":
+        i += 1
+        if pattern[i:i+1] == "^":
+            i += 1
+        if pattern[i:i+1] == "]":      # "[]" and "[^]" start with a literal "]"
+            i += 1
+        while i < len(pattern) and pattern[i] != "]":
+            i += 2 if pattern[i] == "\\" else 1
+        return i + 1
+
+    depth = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            i = _skip_group(pattern, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Variant_Index object which finds spelling variants of a
+    word (e.g. "praesens" and "præsens", or a word with one letter misread
+    by the HTR) among the words of an edition. """
+
+from array import array
+
+class Variant_Index:
+    """ An index of a list of words which finds the words differing from a
+        given word by a few letters (insertions, deletions, substitutions),
+        i.e. whose Levenshtein distance is small:
+
+            index = Variant_Index(["gratia", "praesens", "Christus"])
+            index.find("præsens")  -> 1
+
+        One edit is allowed for every letters_per_edit letters of the longer
+        word, but no more than max_distance edits. So short words (e.g. "et"
+        and "ut") are never variants of each other.
+
+        Not every word of the list is compared with the given word. The
+        candidates are taken from an index of the bigrams (pairs of letters)
+        of the words by their length: a word with k edits shares at least
+        len(word) - 1 - 2k bigrams with the given word (every edit changes at
+        most two bigrams), and its length differs by at most k. Only the
+        candidates sharing enough bigrams are compared (cf.
+        bounded_levenshtein()).
+
+        words            -- a list of words (strings)
+        letters_per_edit -- cf. above
+        max_distance     -- cf. above """
+
+    def __init__(self, words, letters_per_edit=4, max_distance=2):
+        self.words = list(words)
+        self.letters_per_edit = letters_per_edit
+        self.max_distance = max_distance
+        self.postings = {}   # (bigram, length) -> indices of the words
+        self.lengths = {}    # length -> indices of the words
+        for index, word in enumerate(self.words):
+            length = len(word)
+            self.lengths.setdefault(length, []).append(index)
+            for bigram in set(bigrams(word)):
+                self.postings.setdefault((bigram, length), []).append(index)
+
+    def limit(self, length):
+        """ Returns the maximum distance of two words if the longer word
+            has this length. """
+        return min(self.max_distance, length // self.letters_per_edit)
+
+    def candidates(self, word):
+        """ Returns the indices of the words which might be variants of a
+            word (cf. the class docstring). """
+        length = len(word)
+        k = self.limit(length + self.max_distance)  # the longest possible variant
+        lengths = range(max(0, length - k), length + k + 1)
+        threshold = length - 1 - 2 * k
+        if threshold <= 0:
+            # Too short for the bigram filter:
+            return [index for other in lengths for index in self.lengths.get(other, ())]
+
+        counts = {}
+        for bigram in bigrams(word):
+            for other in lengths:
+                for index in self.postings.get((bigram, other), ()):
+                    counts[index] = counts.get(index, 0) + 1
+        return [index for index, count in counts.items() if count >= threshold]
+
+    def find(self, word):
+        """ Returns the index of the closest variant of a word or None if
+            there is none. Of several variants with the same distance, the
+            first one in the list is chosen. """
+        best = None
+        best_distance = self.max_distance + 1
+        for index in sorted(self.candidates(word)):
+            other = self.words[index]
+            limit = min(self.limit(max(len(word), len(other))), best_distance - 1)
+            if limit < 0:
+                break
+            distance = bounded_levenshtein(word, other, limit)
+            if distance <= limit:
+                best, best_distance = index, distance
+        return best
+
+# Helper functions:
+
+def bigrams(word):
+    """ Returns the pairs of neighbouring letters of a word. """
+    return [word[i:i+2] for i in range(len(word) - 1)]
+
+def bounded_levenshtein(a, b, limit):
+    """ Returns the Levenshtein distance of the strings a and b or limit + 1
+        if it is greater than limit.
+
+        Bit-parallel algorithm by Gene Myers (1999) in the formulation of
+        Heikki Hyyrö (2003): the column of the dynamic programming matrix is
+        stored as the bits of two integers (the vertical +1 and -1 deltas),
+        so every letter of b is processed with a few bitwise operations
+        instead of len(a) steps. (Python integers have no fixed size, so a
+        may be of any length.) """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    m = len(a)
+    if m == 0:
+        return len(b)
+
+    # The positions of every letter in a as bits:
+    peq = {}
+    for i, c in enumerate(a):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv = mask, 0
+    score = m
+    remaining = len(b)
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        remaining -= 1
+        # (Each of the remaining letters lowers the distance by 1 at most.)
+        if score - remaining > limit:
+            return limit + 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return score if score <= limit else limit + 1
+
+def map_variants(vocabulary, a, b, **options):
+    """ Eats a Vocabulary and two sequences of word IDs (cf. word_stream.py).
+        Every word of b which does not occur in a but is a variant of a word
+        of a (cf. Variant_Index) is replaced by the ID of that word. Returns
+        the new IDs of b as array('I') (or b itself if nothing was replaced).
+        options are passed to Variant_Index. """
+    ids_1 = sorted(set(a))
+    only_2 = set(b).difference(ids_1)
+    if not only_2:
+        return b
+    words = vocabulary.words
+    index = Variant_Index([words[word_id] for word_id in ids_1], **options)
+    mapping = {}
+    for word_id in sorted(only_2):
+        found = index.find(words[word_id])
+        if found is not None:
+            mapping[word_id] = ids_1[found]
+    if not mapping:
+        return b
+    return array('I', (mapping.get(word_id, word_id) for word_id in b))
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Regression tests for the Cleaner. They need the hunspell dictionary
+    (cf. dictionary.py). Usage: python -m unittest test_cleaner """
+
+import unittest
+from cleaner import Cleaner
+
+class Test_Replace_Macrons(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cleaner = Cleaner("replacement_table.tsv")
+
+    def test_word_final_macron(self):
+        # Wild1559o, page 429, lines r0l4 and r0l5: "vt idē ſapiamus"
+        self.assertEqual(self.cleaner.replace_macrons("idē"), "idem")
+        self.assertEqual(self.cleaner.replace_macrons("fidē"), "fidem")
+        self.assertEqual(self.cleaner.replace_macrons("gaudiū"), "gaudium")
+
+    def test_macron_within_word(self):
+        self.assertEqual(self.cleaner.replace_macrons("cōsolatio"), "consolatio")
+
+if __name__ == "__main__":
+    unittest.main()
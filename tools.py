@@ -49,7 +49,7 @@ class IO_Tools:
             if idx == 0:
                 fieldnames = row # The first row contains the fieldnames.
             else:
-                if not row[0].startswith("#") and (row[0].strip() != ""):   # Skips comments and empty lines.
+                if row and not row[0].startswith("#") and (row[0].strip() != ""):   # Skips comments and empty lines.
                     output[row[0]] = {}
                     for idx, element in enumerate(row[1:], 1): # starting with the second element
                         try:
@@ -4,23 +4,54 @@
     the Transkribus REST-API. """
 
 import requests
+from requests.adapters import HTTPAdapter
+import re
 import json
 from lxml import objectify, etree
 from pprint import pprint
 
+# HTTP status codes (besides 5xx) of errors which may go away if the
+# request is repeated later:
+TRANSIENT_STATUS = (429,)
+
+# Finds the transcript ID in the metadata of a page XML file:
+TSID_PATTERN = re.compile(rb'<TranskribusMetadata[^>]*\stsid="(\d+)"')
+
 class Transkribus_Web():
     """ The Transkribus_Web class implements the communication with the 
         Transkribus REST API. 
         
         All available endpoints: https://transkribus.eu/TrpServer/Swadl/wadl.html
         Documentation: https://readcoop.eu/transkribus/docu/rest-api/
-        Official TranskribusPyClient: https://github.com/Transkribus/TranskribusPyClient """
+        Official TranskribusPyClient: https://github.com/Transkribus/TranskribusPyClient 
+        
+        All requests go through one requests.Session which keeps the connections
+        to the server open (keep-alive) and holds the session cookie:
+        pool_size -- maximum number of open connections (should be at least the
+                     number of threads downloading pages at the same time)
+        timeout   -- seconds to wait for the server: (connect, read)
+        session   -- a requests.Session to use instead of a new one
+        adapter   -- a transport adapter (requests.adapters.BaseAdapter) mounted
+                     for api_base_url, e.g. to test against a local stand-in 
+                     server or to record requests. 
+        
+        cache     -- a Page_Cache object (cf. page_cache.py) which keeps the page
+                     XML on the disk, or False. """
     
-    def __init__(self, api_base_url="https://transkribus.eu/TrpServer/rest/"):
+    def __init__(self, api_base_url="https://transkribus.eu/TrpServer/rest/",
+                 pool_size=10, timeout=(10, 120), session=None, adapter=None,
+                 cache=False):
         self.cols = {}
         self.api_base_url = api_base_url
         self.session_id = False
-        self.cache = False
+        self.cache = cache
+        self.timeout = timeout
+
+        self.session = session if session is not None else requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount(api_base_url, adapter)
     
     # Internal helper functions:
     
@@ -29,6 +60,15 @@ class Transkribus_Web():
             i.e. the API base URL + the relative path of the endpoint. """
         
         return self.api_base_url + endpoint
+
+    def _set_session_cookie(self, session_id):
+        """ Helper function that stores the SESSIONID as a cookie in the 
+            requests.Session (or removes it if session_id is False). All
+            JSESSIONID cookies are removed first, including the ones set by
+            the server for its domain and path. """
+        requests.cookies.remove_cookie_by_name(self.session.cookies, "JSESSIONID")
+        if session_id:
+            self.session.cookies.set("JSESSIONID", session_id)
     
     # Core functionality: login, logout, send GET requests
     
@@ -38,11 +78,12 @@ class Transkribus_Web():
         
         credentials = {'user': username,
                        'pw': password}
-        response = requests.post(self._url("auth/login"), data=credentials)
+        response = self.session.post(self._url("auth/login"), data=credentials, timeout=self.timeout)
         if response:
             r = objectify.fromstring(response.content)
             print(f"TRANSKRIBUS: User {r.firstname} {r.lastname} ({r.userId}) logged in successfully.")
             self.session_id = str(r.sessionId)
+            self._set_session_cookie(self.session_id)
             return str(r.sessionId)
         else:
             print("TRANSKRIBUS: Login failed. HTTP status:", response.status_code)
@@ -51,10 +92,10 @@ class Transkribus_Web():
     def logout(self):
         """ Logs out and sets the "session_id" variable to False. """
         
-        cookies = dict(JSESSIONID=self.session_id)
-        response = requests.post(self._url("auth/logout"), cookies=cookies)
+        response = self.session.post(self._url("auth/logout"), timeout=self.timeout)
         if response:
             self.session_id = False
+            self._set_session_cookie(False)
             print("TRANSKRIBUS: Logged out successfully.")
             return True
         else:
@@ -68,7 +109,7 @@ class Transkribus_Web():
         
         session_id = self.login(username, password)
         if session_id:
-            self.logout(session_id)
+            self.logout()
             return True
         else: 
             return False        
@@ -83,11 +124,12 @@ class Transkribus_Web():
             Depending on the content type (JSON or XML), 
             the function tries to decode the raw content of the response.
             It returns a json object or an "objectify" object (lxml). If
-            the conversion fails the raw content is returned. """
+            the conversion fails the raw content is returned. A transient
+            error of the server (5xx, 429 Too Many Requests) raises
+            requests.HTTPError like a failed connection, so the caller can
+            retry the request (cf. fetcher.py). """
 
-        cookies = dict(JSESSIONID=self.session_id)
-        
-        response = requests.get(self._url(endpoint), cookies=cookies)
+        response = self.session.get(self._url(endpoint), timeout=self.timeout)
 
         if response:
             try:
@@ -99,10 +141,28 @@ class Transkribus_Web():
                     return xml
                 except:
                     return response.content  # fallback option if the server returns just text
+        elif response.status_code in TRANSIENT_STATUS or response.status_code >= 500:
+            response.raise_for_status()
         else:
             print(f'TRANSKRIBUS: ERROR when requesting "{endpoint}". HTTP status:', response.status_code)
             return False
     
+    def request_raw(self, endpoint):
+        """ Sends a GET request to a Transkribus API endpoint (cf. 
+            request_endpoint()) and returns the raw content of the response
+            (bytes) or False. Transient errors raise requests.HTTPError
+            like in request_endpoint(). """
+
+        response = self.session.get(self._url(endpoint), timeout=self.timeout)
+
+        if response:
+            return response.content
+        elif response.status_code in TRANSIENT_STATUS or response.status_code >= 500:
+            response.raise_for_status()
+        else:
+            print(f'TRANSKRIBUS: ERROR when requesting "{endpoint}". HTTP status:', response.status_code)
+            return False
+
     # Convenience functions to query certain endpoints: 
     
     def get_collections(self):
@@ -135,13 +195,17 @@ class Transkribus_Web():
         pages = self.request_endpoint(endpoint)
         return pages if pages else False
         
-    def get_page_xml(self, colId, docId, pageNr):
+    def get_page_xml(self, colId, docId, pageNr, revalidate=True):
         """ Get the XML content of a page. 
             Returns an "objectify" object (lxml) or False if not successful. 
             
             colId -- collection ID in Transkribus (int) 
             docId -- document ID in Transkribus (int) 
             pageNr -- page ID in Transkribus (int) 
+            revalidate -- only used with a cache (self.cache): if True, ask the
+                          server for the ID of the current transcript and use
+                          the cached page only if it is still current. If False,
+                          use the cached page without asking the server.
             
             The returned object X has two attributes: X.Metadata and X.Page. 
             X.Page is empty if there are no transcripts yet. 
@@ -165,9 +229,46 @@ class Transkribus_Web():
 
             """
         
+        page_xml = self.get_page_raw(colId, docId, pageNr, revalidate)
+        return objectify.fromstring(page_xml) if page_xml else False
+
+    def get_page_raw(self, colId, docId, pageNr, revalidate=True):
+        """ Get the XML content of a page as bytes (without parsing it, 
+            cf. page_parser.py). Returns False if not successful. 
+            The arguments are the same as for get_page_xml(). """
+        
         endpoint = f"collections/{colId}/{docId}/{pageNr}/text"
-        page_xml = self.request_endpoint(endpoint)
-        return page_xml if page_xml is not None else False
+        if not self.cache:
+            return self.request_raw(endpoint)
+
+        # Look for the current transcript in the cache:
+        tsId = None
+        if revalidate:
+            try:
+                current_transcript = self.request_endpoint(f"collections/{colId}/{docId}/{pageNr}/curr")
+            except requests.RequestException:
+                current_transcript = False  # (use the cached transcript if the server fails)
+            if current_transcript:
+                tsId = current_transcript['tsId']
+        if tsId is None:
+            tsId = self.cache.latest_tsId(colId, docId, pageNr)
+        if tsId is not None:
+            content = self.cache.get(colId, docId, pageNr, tsId)
+            if content is not None:
+                return content
+
+        # Download the page and store it in the cache:
+        content = self.request_raw(endpoint)
+        if not content:
+            return False
+        if tsId is None:
+            # (The page XML knows the ID of its transcript, too.)
+            metadata = TSID_PATTERN.search(content)
+            if metadata:
+                tsId = metadata.group(1).decode()
+        if tsId is not None:
+            self.cache.store(colId, docId, pageNr, tsId, content)
+        return content
         
     def upload_page_xml(self, colId, docId, pageNr, new_status, page_xml):
         """ Upload page XML data to the Transkribus server using a POST request. 
@@ -190,18 +291,17 @@ class Transkribus_Web():
             return False
         
         headers = {'Content-Type': 'text/xml'} 
-        cookies = dict(JSESSIONID=self.session_id)
         params = {'status': new_status,
                   'parent': tsId,
                   'overwrite': 'false'}
         # convert the page_xml object to a pretty utf-8 string:
         data = etree.tostring(page_xml, pretty_print=True, xml_declaration=True).decode("utf-8")
 
-        response = requests.post(self._url(f"collections/{colId}/{docId}/{pageNr}/text"), 
-                                 headers=headers,
-                                 params=params,
-                                 cookies=cookies, 
-                                 data=data)
+        response = self.session.post(self._url(f"collections/{colId}/{docId}/{pageNr}/text"), 
+                                     headers=headers,
+                                     params=params,
+                                     data=data,
+                                     timeout=self.timeout)
 
         if response:
             print(f"Uploaded page {colId}/{docId}/{pageNr} successfully: {response.status_code}")
@@ -228,13 +328,12 @@ class Transkribus_Web():
         else:
             return False
         
-        cookies = dict(JSESSIONID=self.session_id)
         params = {'status': new_status}
         
         endpoint = f"collections/{colId}/{docId}/{pageNr}/{tsId}"
-        response = requests.post(self._url(endpoint),
-                                 params=params,
-                                 cookies=cookies)
+        response = self.session.post(self._url(endpoint),
+                                     params=params,
+                                     timeout=self.timeout)
         
         if response:
             print(f"TRANSKRIBUS: Updated status of page {pageNr} to {new_status} in collection {colId}, document {docId}.")
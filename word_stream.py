@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Provides the Vocabulary and Word_Stream objects which store the words
+    of an edition as integer IDs for the comparison of two editions. """
+
+import sys
+import base64
+from array import array
+from bisect import bisect_left, bisect_right
+
+class Vocabulary:
+    """ Maps words to integer IDs and back (interning). Every word is stored
+        only once. Two Word_Streams can be compared by their IDs if they
+        share a Vocabulary. """
+
+    def __init__(self):
+        self.ids = {}    # word -> ID
+        self.words = []  # ID -> word
+
+    def __len__(self):
+        return len(self.words)
+
+    def intern(self, word):
+        """ Returns the ID of a word (a new ID if the word is new). """
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return word_id
+
+    def encode(self, words):
+        """ Returns the IDs of a list of words as array('I'). """
+        return array('I', map(self.intern, words))
+
+    def decode(self, ids):
+        """ Returns the words of a sequence of IDs as a list. """
+        words = self.words
+        return [words[word_id] for word_id in ids]
+
+class Word_Stream:
+    """ The words of an edition as an array of integer IDs (cf. Vocabulary)
+        with a separate index of markers, e.g. page and line breaks. The
+        markers are not part of the words and are therefore not compared.
+
+        The line index records the Cts address of every line, so that the
+        address of every word can be computed (cf. address()).
+
+        A Word_Stream can be used like a list of words (len(), iteration,
+        indices and slices return the words), e.g. by Alignment_Engine.
+
+            stream = Word_Stream(vocabulary)
+            stream.add_marker("tr:123.456:1")  # before the next word
+            stream.add_line("tr:123.456:1.r0l0", 1)
+            stream.append("lorem")
+            stream.ids               -> array('I', [0])
+            list(stream.markers())   -> [(0, "tr:123.456:1")]
+            stream.address(0)        -> "tr:123.456:1.r0l0@0" """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.ids = array('I')
+        self.marker_positions = array('I')  # index of the word following the marker
+        self.marker_labels = []
+        self.line_starts = array('I')  # index of the first word of the line
+        self.line_pages = array('I')   # pageNr of the line
+        self.line_labels = []          # Cts address of the line
+
+    @classmethod
+    def from_words(cls, words, vocabulary=None):
+        """ Returns a Word_Stream of a list of words. Words starting with "$$"
+            (the former page and line markers) are added as markers. """
+        stream = cls(vocabulary)
+        for word in words:
+            if word.startswith("$$"):
+                stream.add_marker(word[2:])
+            else:
+                stream.append(word)
+        return stream
+
+    def append(self, word):
+        self.ids.append(self.vocabulary.intern(word))
+
+    def add_marker(self, label):
+        """ Adds a marker before the next word. """
+        self.marker_positions.append(len(self.ids))
+        self.marker_labels.append(label)
+
+    def add_line(self, cts_string, pageNr):
+        """ Adds a line starting with the next word. cts_string is the
+            address of the line, e.g. "tr:123.456:1.r0l0". """
+        self.line_starts.append(len(self.ids))
+        self.line_pages.append(int(pageNr))
+        self.line_labels.append(cts_string)
+
+    def address(self, position):
+        """ Returns the Cts address (string) of a word, e.g.
+            "tr:123.456:1.r0l0@3" for the fourth word of the line (or None
+            if there is no line index). """
+        line = bisect_right(self.line_starts, position) - 1
+        if line < 0:
+            return None
+        # (Empty lines start at the same position as the next line.)
+        return f"{self.line_labels[line]}@{position - self.line_starts[line]}"
+
+    def page_span(self, first, last):
+        """ Returns the positions (start, end) of the words on the pages
+            first to last (inclusive, pageNr as int). """
+        first_line = bisect_left(self.line_pages, first)
+        last_line = bisect_right(self.line_pages, last)
+        start = self.line_starts[first_line] if first_line < len(self.line_starts) else len(self.ids)
+        end = self.line_starts[last_line] if last_line < len(self.line_starts) else len(self.ids)
+        return start, end
+
+    def markers(self, start=0, end=None):
+        """ Yields the markers (position, label) before the words start
+            to end (exclusive; None = including the markers at the end). """
+        first = bisect_left(self.marker_positions, start)
+        last = len(self.marker_positions) if end is None else bisect_left(self.marker_positions, end)
+        for k in range(first, last):
+            yield self.marker_positions[k], self.marker_labels[k]
+
+    def to_dict(self):
+        """ Returns the stream (without the vocabulary) as a dict of strings
+            and lists which can be written as JSON. """
+        return {'ids': pack_array(self.ids),
+                'marker_positions': pack_array(self.marker_positions),
+                'marker_labels': self.marker_labels,
+                'line_starts': pack_array(self.line_starts),
+                'line_pages': pack_array(self.line_pages),
+                'line_labels': self.line_labels}
+
+    @classmethod
+    def from_dict(cls, data, vocabulary):
+        """ Returns the Word_Stream of a dict returned by to_dict(). """
+        stream = cls(vocabulary)
+        stream.ids = unpack_array(data['ids'])
+        stream.marker_positions = unpack_array(data['marker_positions'])
+        stream.marker_labels = data['marker_labels']
+        stream.line_starts = unpack_array(data['line_starts'])
+        stream.line_pages = unpack_array(data['line_pages'])
+        stream.line_labels = data['line_labels']
+        return stream
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        words = self.vocabulary.words
+        for word_id in self.ids:
+            yield words[word_id]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.vocabulary.decode(self.ids[index])
+        return self.vocabulary.words[self.ids[index]]
+
+# Helper functions:
+
+def pack_array(values):
+    """ Returns an array (e.g. array('I')) as a base64 string (little endian). """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+def unpack_array(string, typecode='I'):
+    """ Returns the array of a string returned by pack_array(). """
+    values = array(typecode)
+    values.frombytes(base64.b64decode(string))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values